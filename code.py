@@ -12,13 +12,15 @@ GENOTYPE_ORDER = ["IL-17 KO", "C57Bl/6J"]
 
 # ------------------ CORE LOGIC ------------------ #
 
-def assign_balanced_exit_arms(animal_data):
+def assign_balanced_exit_arms(animal_data, rng=None):
     """
     Learning-days exit-arm assignment:
       1) Within each (Genotype, Sex, Cage) group we 'cycle' arms for fairness.
       2) Globally, totals for arms 1/2/3 are as balanced as possible.
+    rng: random.Random to draw from (defaults to the global random module).
     """
     from collections import Counter
+    rng = random if rng is None else rng
 
     # Group animals
     groupings = defaultdict(list)
@@ -26,13 +28,13 @@ def assign_balanced_exit_arms(animal_data):
         key = (animal['Genotype'], animal['Sex'], animal['Cage'])
         groupings[key].append(animal)
 
-    # Shuffle for fairness (seed is controlled by GUI)
+    # Shuffle for fairness (rng is seeded by the GUI)
     groups = []
     for key, animals in groupings.items():
         animals = animals[:]
-        random.shuffle(animals)
+        rng.shuffle(animals)
         groups.append((key, animals))
-    random.shuffle(groups)
+    rng.shuffle(groups)
 
     # Global targets
     N = len(animal_data)
@@ -63,7 +65,7 @@ def assign_balanced_exit_arms(animal_data):
             if remaining[arm] > 0:
                 adjusted.append(arm); remaining[arm] -= 1
             else:
-                alt = max((1, 2, 3), key=lambda a: (remaining[a], random.random()))
+                alt = max((1, 2, 3), key=lambda a: (remaining[a], rng.random()))
                 adjusted.append(alt); remaining[alt] -= 1
 
         for animal, arm in zip(animals, adjusted):
@@ -163,6 +165,10 @@ def build_nonlearning_plan_cage_packs(animal_data, learning_exit_map):
     plans = {c: {s: plan_cage_dp(cages[c], s, learning_exit_map) for s in (1, 2, 3)}
              for c in cage_names}
 
+    # Ties go to the cage entered first, so the order never depends on
+    # set() iteration order (which varies with the string hash seed)
+    rank = {c: i for i, c in enumerate(cage_names)}
+
     best_total = None
     best_solution = None  # (start_arm, cage_sequence, chosen_plans_per_cage)
 
@@ -178,7 +184,7 @@ def build_nonlearning_plan_cage_packs(animal_data, learning_exit_map):
             while remaining:
                 if current is None:
                     # pick next cage that is cheapest given prev_end
-                    current = min(remaining, key=lambda ck: plans[ck][prev_end]['cost'])
+                    current = min(remaining, key=lambda ck: (plans[ck][prev_end]['cost'], rank[ck]))
                 plan = plans[current][prev_end]
                 total_cost += plan['cost']
                 seq.append(current)
@@ -209,37 +215,101 @@ def build_nonlearning_plan_cage_packs(animal_data, learning_exit_map):
     return ordered_animals, per_animal_exit
 
 
-def generate_pseudorandom_sequence(n_trials, armA, armB, avoid_first=None):
+class InfeasibleSequenceError(ValueError):
+    """Raised when no start-arm sequence satisfies the trial constraints."""
+
+
+def count_valid_sequences(max_a, max_b):
+    """
+    Counting DP: counts[a][b][last][run] = number of ways to place `a` more A's
+    (symbol 0) and `b` more B's (symbol 1) with no triple repeats, after a run
+    of `run` (1 or 2) copies of symbol `last`.
+    """
+    counts = [[[[0, 0, 0], [0, 0, 0]] for _ in range(max_b + 1)] for _ in range(max_a + 1)]
+    for total in range(max_a + max_b + 1):
+        for a in range(max(0, total - max_b), min(max_a, total) + 1):
+            b = total - a
+            for last in (0, 1):
+                for run in (1, 2):
+                    if a == 0 and b == 0:
+                        counts[a][b][last][run] = 1
+                        continue
+                    n = 0
+                    if a > 0 and not (last == 0 and run == 2):
+                        n += counts[a - 1][b][0][run + 1 if last == 0 else 1]
+                    if b > 0 and not (last == 1 and run == 2):
+                        n += counts[a][b - 1][1][run + 1 if last == 1 else 1]
+                    counts[a][b][last][run] = n
+    return counts
+
+
+def sample_sequence_template(counts, count_a, count_b, forbid_first=None, rng=None):
+    """
+    Draw one valid 0/1 template uniformly (O(n) walk over the count table).
+    forbid_first (0 or 1) excludes that symbol from the first position.
+    """
+    rng = random if rng is None else rng
+    a, b = count_a, count_b
+    if a + b == 0:
+        return []
+
+    weights = [0, 0]
+    if a > 0 and forbid_first != 0: weights[0] = counts[a - 1][b][0][1]
+    if b > 0 and forbid_first != 1: weights[1] = counts[a][b - 1][1][1]
+    if weights[0] + weights[1] == 0:
+        raise InfeasibleSequenceError(
+            f"No start-arm sequence with {count_a}/{count_b} trials avoids a triple repeat"
+            + (" and the forbidden first arm." if forbid_first is not None else ".")
+        )
+
+    seq = []
+    last, run = None, 0
+    while a + b > 0:
+        if last is not None:
+            weights = [0, 0]
+            if a > 0 and not (last == 0 and run == 2):
+                weights[0] = counts[a - 1][b][0][run + 1 if last == 0 else 1]
+            if b > 0 and not (last == 1 and run == 2):
+                weights[1] = counts[a][b - 1][1][run + 1 if last == 1 else 1]
+        sym = 0 if rng.randrange(weights[0] + weights[1]) < weights[0] else 1
+        run = run + 1 if sym == last else 1
+        last = sym
+        if sym == 0: a -= 1
+        else: b -= 1
+        seq.append(sym)
+    return seq
+
+
+def generate_pseudorandom_sequence(n_trials, armA, armB, avoid_first=None, rng=None, counts=None):
     """
     Generate a pseudo-random start-arm sequence (values armA/armB) with near-balance
     and no triple repeats. If avoid_first is provided, first element != avoid_first.
+    Drawn uniformly among valid sequences; raises InfeasibleSequenceError if none exist.
+    Pass a count_valid_sequences table for n_trials as counts to reuse it across calls.
     """
+    rng = random if rng is None else rng
     countA, countB = n_trials // 2, n_trials // 2
+    allocations = [(countA, countB)]
     if n_trials % 2 == 1:
-        if random.random() < 0.5: countA += 1
-        else: countB += 1
+        if rng.random() < 0.5: allocations = [(countA + 1, countB), (countA, countB + 1)]
+        else: allocations = [(countA, countB + 1), (countA + 1, countB)]
 
-    pool = [armA] * countA + [armB] * countB
-    random.shuffle(pool)
+    forbid_first = {armA: 0, armB: 1}.get(avoid_first)
+    if counts is None:
+        counts = count_valid_sequences(countA + n_trials % 2, countB + n_trials % 2)
 
-    def valid(seq): return len(seq) < 3 or not (seq[-1] == seq[-2] == seq[-3])
-
-    def backtrack(cur, items):
-        if not items: return cur
-        for i, cand in enumerate(items):
-            if avoid_first is not None and len(cur) == 0 and cand == avoid_first:
-                continue
-            new = cur + [cand]
-            if valid(new):
-                out = backtrack(new, items[:i] + items[i+1:])
-                if out is not None: return out
-        return None
-
-    seq = backtrack([], pool)
-    return seq if seq else pool
+    # odd trial counts: fall back to the other balance only if the first-arm
+    # constraint makes the drawn one impossible
+    for i, (count_a, count_b) in enumerate(allocations):
+        try:
+            template = sample_sequence_template(counts, count_a, count_b, forbid_first, rng)
+        except InfeasibleSequenceError:
+            if i == len(allocations) - 1: raise
+            continue
+        return [armA if sym == 0 else armB for sym in template]
 
 
-def generate_day_tables(animal_data, learning_days, reversal_days, n_trials, exit_arm_map):
+def generate_day_tables(animal_data, learning_days, reversal_days, n_trials, exit_arm_map, rng=None):
     """
     Build per-day tables.
 
@@ -256,6 +326,9 @@ def generate_day_tables(animal_data, learning_days, reversal_days, n_trials, exi
         return [], []
 
     base_order_animals = list(animal_data)
+    # the counting table only depends on n_trials: build it once, not per animal
+    max_count = n_trials // 2 + n_trials % 2
+    counts = count_valid_sequences(max_count, max_count)
 
     day_tables_data, day_tables_text = [], []
 
@@ -285,7 +358,8 @@ def generate_day_tables(animal_data, learning_days, reversal_days, n_trials, exi
             # Non-learning: avoid_first = learning-day exit (differs from prior phase)
             avoid_first = exit_arm_today if in_learning else exit_arm_map[aid]
 
-            seq = generate_pseudorandom_sequence(n_trials, armA, armB, avoid_first=avoid_first)
+            seq = generate_pseudorandom_sequence(n_trials, armA, armB, avoid_first=avoid_first, rng=rng,
+                                                 counts=counts)
             row = [aid, animal['Tag'], animal['Sex'], animal['Genotype'], animal['Cage'], exit_arm_today] + seq
             rows.append(row)
 
@@ -451,19 +525,23 @@ class YMazeApp(tk.Tk):
 
         if self.var_seed_on.get():
             try:
-                random.seed(int(self.var_seed_val.get()))
+                rng = random.Random(int(self.var_seed_val.get()))
             except ValueError:
                 messagebox.showerror("Invalid seed", "Seed must be an integer.")
                 return
         else:
-            random.seed()
+            rng = random.Random()
 
         # Learning-day baseline map
-        learning_exit_map = assign_balanced_exit_arms(animal_data)
+        learning_exit_map = assign_balanced_exit_arms(animal_data, rng)
 
-        self.day_tables_data, self.day_tables_text = generate_day_tables(
-            animal_data, learning_days, reversal_days, n_trials, learning_exit_map
-        )
+        try:
+            self.day_tables_data, self.day_tables_text = generate_day_tables(
+                animal_data, learning_days, reversal_days, n_trials, learning_exit_map, rng=rng
+            )
+        except InfeasibleSequenceError as e:
+            messagebox.showerror("Invalid input", str(e))
+            return
 
         self.txt_output.delete("1.0", tk.END)
         for t in self.day_tables_text:
@@ -0,0 +1,73 @@
+"""
+Encode-time benchmark for schedule responses.
+
+Compares FastAPI's default path (jsonable_encoder + json.dumps) with
+`dumps_json` on every JSON backend installed here, for a synthetic cohort.
+
+    python bench_json.py --animals 300 --days 30 --trials 20
+"""
+
+import argparse
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+import main
+
+
+def build_payload(n_animals: int, n_days: int, n_trials: int, response_format: str):
+    animals = [
+        {"AnimalID": f"A{i}", "Tag": str(1000 + i), "Sex": "MF"[i % 2], "Genotype": "WT", "Cage": f"Cage{i // 4}"}
+        for i in range(n_animals)
+    ]
+    rng = random.Random(0)
+    exit_arm_map = main.assign_balanced_exit_arms(animals, rng)
+    learning_days = max(1, n_days * 2 // 3)
+    day_tables = main.generate_day_tables(animals, learning_days, n_days - learning_days, n_trials,
+                                          exit_arm_map, batch=True, rng=rng)
+    return main.schedule_payload({"exit_arm_map": exit_arm_map, "day_tables": day_tables}, response_format)
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def encoders():
+    yield "fastapi default", lambda p: json.dumps(jsonable_encoder(p)).encode("utf-8")
+    yield "stdlib json", lambda p: json.dumps(p, separators=(",", ":")).encode("utf-8")
+    if main.msgspec is not None:
+        enc = main.msgspec.json.Encoder()
+        yield "msgspec", enc.encode
+    if main.orjson is not None:
+        yield "orjson", lambda p: main.orjson.dumps(p, option=main.orjson.OPT_SERIALIZE_NUMPY)
+    yield f"dumps_json ({main.JSON_BACKEND})", main.dumps_json
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--animals", type=int, default=300)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--format", choices=("tables", "columnar"), default="tables")
+    args = parser.parse_args()
+
+    payload = build_payload(args.animals, args.days, args.trials, args.format)
+    print(f"{args.animals} animals x {args.days} days x {args.trials} trials, format={args.format}")
+    baseline = None
+    for name, encode in encoders():
+        size = len(encode(payload))
+        elapsed = best_of(lambda: encode(payload), args.repeat)
+        baseline = baseline or elapsed
+        print(f"  {name:<22} {elapsed * 1000:9.1f} ms  {size / 1e6:7.2f} MB  x{baseline / elapsed:5.1f}")
+
+
+if __name__ == "__main__":
+    main_cli()
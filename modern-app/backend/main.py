@@ -4,20 +4,62 @@ Extracted from the original Tkinter application.
 Handles all the core scheduling logic.
 """
 
+import asyncio
+import codecs
+import csv
+import hashlib
 import io
+import json
+import math
+import mmap
+import multiprocessing
+import os
 import random
-from collections import defaultdict, OrderedDict, Counter
+import re
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from collections import defaultdict, deque, OrderedDict, Counter
+from itertools import combinations
+from multiprocessing import resource_tracker, shared_memory
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Union
+from xml.sax.saxutils import escape as xml_escape
 
+import numpy as np
 import pandas as pd
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, Field
-
-
-app = FastAPI(title="Y-Maze Randomizer API")
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, model_validator
+
+try:  # Optional fast JSON encoders; see dumps_json
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if os.environ.get("YMAZE_PREWARM", "1") != "0":
+        await run_in_threadpool(engine_executor.warm)
+    yield
+    engine_executor.shutdown()
+    job_queue.shutdown()
+
+
+app = FastAPI(title="Y-Maze Randomizer API", lifespan=lifespan)
 
 # CORS middleware to allow frontend communication
 app.add_middleware(
@@ -33,6 +75,9 @@ app.add_middleware(
 
 # ==================== MODELS ====================
 
+ANIMAL_FIELDS = ("AnimalID", "Tag", "Sex", "Genotype", "Cage")
+
+
 class AnimalInput(BaseModel):
     AnimalID: str
     Tag: str
@@ -41,16 +86,271 @@ class AnimalInput(BaseModel):
     Cage: str
 
 
+class AnimalColumns(BaseModel):
+    """
+    Bulk animal input as parallel arrays, one entry per animal.
+
+    Validated as five string lists instead of one model per animal, which is
+    what makes very large cohorts cheap to accept.
+    """
+    AnimalID: List[str]
+    Tag: List[str]
+    Sex: List[str]
+    Genotype: List[str]
+    Cage: List[str]
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        lengths = {name: len(getattr(self, name)) for name in ANIMAL_FIELDS}
+        if len(set(lengths.values())) > 1:
+            raise ValueError(f"Animal columns must have equal lengths, got {lengths}")
+        return self
+
+    def __len__(self):
+        return len(self.AnimalID)
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Animal dicts in the engine's row format."""
+        columns = [getattr(self, name) for name in ANIMAL_FIELDS]
+        return [dict(zip(ANIMAL_FIELDS, values)) for values in zip(*columns)]
+
+
 class ScheduleRequest(BaseModel):
-    animals: List[AnimalInput]
+    # Either a list of animal objects or an AnimalColumns object of parallel arrays
+    animals: Union[List[AnimalInput], AnimalColumns]
     learning_days: int = Field(..., gt=0)
     reversal_days: int = Field(..., ge=0)
     trials_per_day: int = Field(..., gt=0)
     seed: Optional[int] = None
     use_example: bool = False
+    batch: bool = False
+    exact_cage_order: bool = False
+    # Counter-based per-cell randomness; see KeyedRandom
+    keyed_rng: bool = False
+    # Build days in parallel on the process pool; see iter_day_tables_parallel
+    parallel_days: bool = False
+
+
+class CellRequest(BaseModel):
+    schedule: ScheduleRequest
+    day: int = Field(..., gt=0)
+    animal_id: str
+
+
+BATCH_MAX_COHORTS = 100
+
+
+class BatchScheduleRequest(BaseModel):
+    # Validated one by one as ScheduleRequest, so a bad cohort fails alone
+    cohorts: List[Dict[str, Any]] = Field(..., min_length=1, max_length=BATCH_MAX_COHORTS)
+    # Seeds cohorts that have none of their own (drawn at random if omitted);
+    # see derive_cohort_seed
+    seed: Optional[int] = None
 
 
 # ==================== CORE LOGIC ====================
+class ScheduleCancelledError(RuntimeError):
+    """Raised inside the engine once its cancellation token has been set."""
+
+
+# tmpfs where available, so the cancellation flag file never touches disk
+_CANCEL_FLAG_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def _release_flag(flag: mmap.mmap, path: Optional[str]):
+    flag.close()
+    if path is not None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation flag checked between days and cage plans.
+
+    `shared=True` mirrors the flag into a one-byte memory-mapped file so the
+    token still works after being pickled into a worker process. The
+    creating process owns the file; it is removed by `close()` or when the
+    token is garbage collected.
+    """
+
+    def __init__(self, shared: bool = False):
+        self._event = threading.Event()
+        self._flag = None
+        self._path = None
+        if shared:
+            fd, path = tempfile.mkstemp(prefix="ymaze-cancel-", dir=_CANCEL_FLAG_DIR)
+            os.write(fd, b"\0")
+            self._attach(fd, path, owner=True)
+
+    def _attach(self, fd: int, path: str, owner: bool):
+        try:
+            self._flag = mmap.mmap(fd, 1)
+        finally:
+            os.close(fd)
+        self._path = path
+        self._release = weakref.finalize(self, _release_flag, self._flag, path if owner else None)
+
+    def cancel(self):
+        self._event.set()
+        flag = self._flag
+        if flag is not None:
+            flag[0] = 1
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        flag = self._flag
+        return flag is not None and flag[0] == 1
+
+    def close(self):
+        """Drop the shared flag once no worker can still be checking it."""
+        if self._flag is not None:
+            self._flag = None
+            self._release()
+
+    def __getstate__(self):
+        return {"path": self._path if self._flag is not None else None, "cancelled": self.cancelled}
+
+    def __setstate__(self, state):
+        self._event = threading.Event()
+        self._flag = None
+        self._path = None
+        if state["cancelled"]:
+            self._event.set()
+        elif state["path"] is not None:
+            try:
+                fd = os.open(state["path"], os.O_RDWR)
+            except FileNotFoundError:
+                # The owner only drops the flag once it no longer wants the result
+                self._event.set()
+            else:
+                self._attach(fd, state["path"], owner=False)
+
+
+def check_cancelled(cancel: Optional[CancellationToken]):
+    """Raise ScheduleCancelledError if `cancel` has been set."""
+    if cancel is not None and cancel.cancelled:
+        raise ScheduleCancelledError("Schedule computation was cancelled.")
+
+
+RandomSource = Union[random.Random, np.random.Generator]
+
+
+class GeneratorRandom(random.Random):
+    """`random.Random` API drawing from a `numpy.random.Generator`."""
+
+    def __init__(self, generator: np.random.Generator):
+        self.generator = generator
+        super().__init__()
+
+    def seed(self, *args, **kwargs):
+        # State lives in the wrapped generator.
+        pass
+
+    def random(self) -> float:
+        return float(self.generator.random())
+
+    def getrandbits(self, k: int) -> int:
+        if k <= 0:
+            return 0
+        return int.from_bytes(self.generator.bytes((k + 7) // 8), "little") >> (-k % 8)
+
+
+def as_python_rng(rng: Optional[RandomSource] = None):
+    """
+    `random`-module API for `rng`. None falls back to the global `random`
+    module, which is only safe for single-threaded callers.
+    """
+    if rng is None:
+        return random
+    if isinstance(rng, np.random.Generator):
+        return GeneratorRandom(rng)
+    return rng
+
+
+def as_numpy_rng(rng: Optional[RandomSource] = None) -> np.random.Generator:
+    """NumPy generator for `rng`, seeded from it when it is a `random.Random`."""
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.default_rng(as_python_rng(rng).getrandbits(128))
+
+
+# Philox4x32-10 constants (Salmon et al., "Parallel random numbers: as easy as 1, 2, 3")
+_PHILOX_M = (np.uint64(0xD2511F53), np.uint64(0xCD9E8D57))
+_PHILOX_W = (np.uint64(0x9E3779B9), np.uint64(0xBB67AE85))
+_MASK32 = np.uint64(0xFFFFFFFF)
+_EXIT_ARM_STREAM = 0xFFFFFFFF
+
+
+def philox4x32(counter: np.ndarray, key: np.ndarray) -> np.ndarray:
+    """
+    Philox4x32-10 block function, vectorized over rows.
+
+    `counter` is (..., 4) and `key` (..., 2) of 32-bit words stored as uint64;
+    returns the (..., 4) output words.
+    """
+    c0, c1, c2, c3 = (counter[..., i].astype(np.uint64) for i in range(4))
+    k0, k1 = key[..., 0].astype(np.uint64), key[..., 1].astype(np.uint64)
+    shift = np.uint64(32)
+    for r in range(10):
+        if r:
+            k0 = (k0 + _PHILOX_W[0]) & _MASK32
+            k1 = (k1 + _PHILOX_W[1]) & _MASK32
+        p0 = _PHILOX_M[0] * c0
+        p1 = _PHILOX_M[1] * c2
+        c0, c1, c2, c3 = ((p1 >> shift) ^ c1 ^ k0, p1 & _MASK32,
+                          (p0 >> shift) ^ c3 ^ k1, p0 & _MASK32)
+    return np.stack([c0, c1, c2, c3], axis=-1)
+
+
+def _hash_words(text: str) -> tuple:
+    """Two 32-bit words identifying `text`."""
+    value = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+    return value & 0xFFFFFFFF, value >> 32
+
+
+class KeyedRandom:
+    """
+    Counter-based randomness keyed by (seed, day, AnimalID).
+
+    Every schedule cell gets its own Philox stream: the key comes from the
+    seed and the counter from the day index and a hash of the AnimalID. Any
+    cell can be regenerated on its own, and its draws do not depend on
+    cohort order, other cells or worker count.
+    """
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.key = np.array(_hash_words(f"ymaze:{seed}"), dtype=np.uint64)
+
+    def uniforms(self, days: np.ndarray, animal_ids: List[str], count: int) -> np.ndarray:
+        """
+        `count` uniforms in [0, 1) for each cell (days[i], animal_ids[i]).
+
+        Returns shape (cells, count); row i depends only on the seed and its cell.
+        """
+        days = np.asarray(days, dtype=np.uint64)
+        ids = np.array([_hash_words(str(aid)) for aid in animal_ids], dtype=np.uint64).reshape(-1, 2)
+        n_blocks = (count + 1) // 2  # two 53-bit doubles per 4-word block
+        counter = np.empty((len(ids), n_blocks, 4), dtype=np.uint64)
+        counter[..., 0] = np.arange(n_blocks, dtype=np.uint64)
+        counter[..., 1] = days[:, None]
+        counter[..., 2] = ids[:, None, 0]
+        counter[..., 3] = ids[:, None, 1]
+        words = philox4x32(counter, self.key).reshape(len(ids), n_blocks * 2, 2)
+        doubles = ((words[..., 0] >> np.uint64(5)) * np.uint64(1 << 26) + (words[..., 1] >> np.uint64(6)))
+        return (doubles * (1.0 / (1 << 53)))[:, :count]
+
+    def exit_arm_rng(self) -> random.Random:
+        """Stream for the cohort-level exit-arm assignment."""
+        key = int(self.key[0]) | int(self.key[1]) << 32
+        return GeneratorRandom(np.random.Generator(np.random.Philox(key=key, counter=[0, _EXIT_ARM_STREAM, 0, 0])))
+
+
 ROOT_DIR = Path(__file__).resolve().parent.parent
 EXAMPLE_ANIMALS_PATH = ROOT_DIR / "example_data" / "animals.csv"
 
@@ -69,10 +369,11 @@ def load_example_animals() -> List[Dict[str, Any]]:
     }).to_dict('records')
 
 
-def assign_balanced_exit_arms(animal_data: List[Dict]) -> Dict[str, int]:
+def assign_balanced_exit_arms(animal_data: List[Dict], rng: Optional[RandomSource] = None) -> Dict[str, int]:
     """
     Learning-days exit-arm assignment with balanced distribution.
     """
+    rng = as_python_rng(rng)
     groupings = defaultdict(list)
     for animal in animal_data:
         key = (animal['Genotype'], animal['Sex'], animal['Cage'])
@@ -81,9 +382,9 @@ def assign_balanced_exit_arms(animal_data: List[Dict]) -> Dict[str, int]:
     groups = []
     for key, animals in groupings.items():
         animals = animals[:]
-        random.shuffle(animals)
+        rng.shuffle(animals)
         groups.append((key, animals))
-    random.shuffle(groups)
+    rng.shuffle(groups)
 
     N = len(animal_data)
     base = N // 3
@@ -116,7 +417,7 @@ def assign_balanced_exit_arms(animal_data: List[Dict]) -> Dict[str, int]:
                 adjusted.append(arm)
                 remaining[arm] -= 1
             else:
-                alt = max((1, 2, 3), key=lambda a: (remaining[a], random.random()))
+                alt = max((1, 2, 3), key=lambda a: (remaining[a], rng.random()))
                 adjusted.append(alt)
                 remaining[alt] -= 1
 
@@ -176,36 +477,304 @@ def plan_cage_dp(cage_animals: List[Dict], prev_arm: Optional[int], learning_exi
     return {'cost': total_cost, 'end': end_color, 'first': first_color, 'colors': colors}
 
 
-def build_nonlearning_plan_cage_packs(animal_data: List[Dict], learning_exit_map: Dict[str, int]):
+# Cost used for arms an animal may not take in the batched cage DP.
+_FORBIDDEN_COST = 1 << 20
+# _SWITCH_COST[new, prev] = 1 if the arm changes between consecutive animals.
+_SWITCH_COST = 1 - np.eye(3, dtype=np.int32)
+
+
+def plan_cages_batch(forbidden: np.ndarray, offsets: np.ndarray) -> Dict[str, np.ndarray]:
     """
-    Reorder cages to minimize switches on non-learning days.
+    `plan_cage_dp` for every cage and every incoming arm at once.
+
+    `forbidden` holds each animal's learning exit (1-3), grouped by cage so
+    that cage k owns forbidden[offsets[k]:offsets[k+1]]. Lanes are
+    (cage, incoming arm) pairs; the DP advances one animal position per step
+    across all lanes, with ties broken towards the lower arm exactly as the
+    dict-based DP does. Returns arrays indexed [cage, incoming_arm - 1]:
+    cost, end and first, plus colors[cage, arm - 1, position].
     """
-    cages = group_animals_by_cage_in_order(animal_data)
+    lengths = np.diff(offsets)
+    n_cages, width = len(lengths), int(lengths.max(initial=0))
+    pos = np.arange(width)
+    present = pos[None, :] < lengths[:, None]
+    padded = np.zeros((n_cages, width), dtype=np.int64)
+    padded[present] = forbidden
+
+    # blocked[cage, position, arm]: animal may not take that arm.
+    blocked = padded[..., None] == np.arange(1, 4)
+    penalty = np.where(blocked, _FORBIDDEN_COST, 0).astype(np.int32)
+
+    incoming = np.arange(3)
+    dp = np.broadcast_to(_SWITCH_COST[None, incoming, :], (n_cages, 3, 3)) + penalty[:, None, 0, :]
+    parents = np.zeros((n_cages, 3, width, 3), dtype=np.int8)
+    for i in range(1, width):
+        # cand[cage, incoming, new, prev]
+        cand = dp[:, :, None, :] + _SWITCH_COST
+        prev = cand.argmin(axis=3)
+        best = np.take_along_axis(cand, prev[..., None], axis=3)[..., 0] + penalty[:, None, i, :]
+        active = present[:, i][:, None, None]
+        dp = np.where(active, best, dp)
+        parents[:, :, i, :] = prev
+
+    end = dp.argmin(axis=2)
+    cost = np.take_along_axis(dp, end[..., None], axis=2)[..., 0]
+
+    colors = np.zeros((n_cages, 3, width), dtype=np.int8)
+    current = end.copy()
+    for i in range(width - 1, -1, -1):
+        is_last = (lengths == i + 1)[:, None]
+        inside = (lengths > i + 1)[:, None]
+        if i + 1 < width:
+            from_next = np.take_along_axis(parents[:, :, i + 1, :], current[..., None], axis=2)[..., 0]
+            current = np.where(inside, from_next, current)
+        current = np.where(is_last, end, current)
+        colors[:, :, i] = current + 1
+
+    return {
+        "cost": cost.astype(np.int64),
+        "end": (end + 1).astype(np.int8),
+        "first": colors[:, :, 0],
+        "colors": colors,
+    }
+
+
+def plan_all_cages(cages: OrderedDict, learning_exit_map: Dict[str, int]) -> Dict[Any, Dict[int, Dict]]:
+    """Per-cage, per-incoming-arm plans in `plan_cage_dp` format via `plan_cages_batch`."""
     cage_names = list(cages.keys())
-
-    plans = {c: {s: plan_cage_dp(cages[c], s, learning_exit_map) for s in (1, 2, 3)}
-             for c in cage_names}
+    lengths = [len(cages[c]) for c in cage_names]
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    forbidden = np.array([learning_exit_map[a['AnimalID']] for c in cage_names for a in cages[c]], dtype=np.int64)
+    batch = plan_cages_batch(forbidden, offsets)
+
+    cost, end, colors = batch["cost"].tolist(), batch["end"].tolist(), batch["colors"].tolist()
+    plans = {}
+    for k, c in enumerate(cage_names):
+        m = lengths[k]
+        plans[c] = {}
+        for s in (1, 2, 3):
+            seq = colors[k][s - 1][:m]
+            plans[c][s] = {'cost': cost[k][s - 1], 'end': end[k][s - 1], 'first': seq[0], 'colors': seq}
+    return plans
+
+
+_DP_INF = 1 << 30
+# Arm -> (x, y) change in the arms' out-minus-in imbalance; arm 3 is implied.
+_ARM_AXIS = {1: (1, 0), 2: (0, 1), 3: (0, 0)}
+
+
+def _arc_order_dp(units: List[List[tuple]], arms: tuple, budget: int):
+    """
+    Min-cost choice of one arc per unit such that the arcs form a connected,
+    balanced multigraph on `arms` (i.e. an Eulerian circuit exists).
+
+    Each unit is a list of (from_arm, to_arm, cost) options. The DP state is the
+    imbalance vector plus a bitmask of arms touched by a non-loop arc, which
+    must cover every arm at the end. States costing more than `budget` are
+    pruned and the grid is cropped to the live states after every unit.
+    Returns (cost, option index per unit) or None.
+    """
+    full_mask = sum(1 << (a - 1) for a in arms)
+    n_units = len(units)
+    dp = np.full((8, 1, 1), _DP_INF, dtype=np.int32)
+    dp[0, 0, 0] = 0
+    x0 = y0 = 0
+    steps = []
+
+    for k, options in enumerate(units):
+        # A coordinate moves by at most 1 per unit, so states further out than
+        # the remaining units can repair are dropped.
+        radius = min(k + 1, n_units - k - 1)
+        nx0, ny0 = max(-radius, x0 - 1), max(-radius, y0 - 1)
+        nx1, ny1 = min(radius, x0 + dp.shape[1]), min(radius, y0 + dp.shape[2])
+        if nx0 > nx1 or ny0 > ny1:
+            return None
+        new = np.full((8, nx1 - nx0 + 1, ny1 - ny0 + 1), _DP_INF, dtype=np.int32)
+        choice = np.zeros(new.shape, dtype=np.uint8)
+        live = [m for m in range(8) if dp[m].min() < _DP_INF]
+
+        for o, (s, e, cost) in enumerate(options):
+            dx = _ARM_AXIS[s][0] - _ARM_AXIS[e][0]
+            dy = _ARM_AXIS[s][1] - _ARM_AXIS[e][1]
+            bits = 0 if s == e else (1 << (s - 1)) | (1 << (e - 1))
+            # Old cell i lands on new cell i + off.
+            spans = []
+            for off, n_old, n_new in ((x0 + dx - nx0, dp.shape[1], new.shape[1]),
+                                      (y0 + dy - ny0, dp.shape[2], new.shape[2])):
+                lo, hi = max(0, -off), min(n_old, n_new - off)
+                spans.append((slice(lo, hi), slice(lo + off, hi + off)))
+            if any(old.start >= old.stop for old, _ in spans):
+                continue
+            (old_x, new_x), (old_y, new_y) = spans
+            for mask in live:
+                cand = dp[mask, old_x, old_y] + cost
+                dst = new[mask | bits, new_x, new_y]
+                better = cand < dst
+                if better.any():
+                    dst[better] = cand[better]
+                    choice[mask | bits, new_x, new_y][better] = o * 8 + mask
+
+        new[new > budget] = _DP_INF
+        alive = new < _DP_INF
+        if not alive.any():
+            return None
+        xs = np.flatnonzero(alive.any(axis=(0, 2)))
+        ys = np.flatnonzero(alive.any(axis=(0, 1)))
+        crop = (slice(None), slice(xs[0], xs[-1] + 1), slice(ys[0], ys[-1] + 1))
+        dp, x0, y0 = new[crop], nx0 + xs[0], ny0 + ys[0]
+        steps.append((choice[crop], x0, y0))
+
+    if x0 != 0 or y0 != 0 or dp[full_mask, 0, 0] >= _DP_INF:
+        return None
+    best = int(dp[full_mask, 0, 0])
+
+    picks = [0] * n_units
+    mask, x, y = full_mask, 0, 0
+    for k in range(n_units - 1, -1, -1):
+        choice, cx0, cy0 = steps[k]
+        o, mask = divmod(int(choice[mask, x - cx0, y - cy0]), 8)
+        s, e, _ = units[k][o]
+        picks[k] = o
+        x -= _ARM_AXIS[s][0] - _ARM_AXIS[e][0]
+        y -= _ARM_AXIS[s][1] - _ARM_AXIS[e][1]
+    return best, picks
+
+
+def solve_cage_order_exact(cage_names: List[Any], plans: Dict[Any, Dict[int, Dict]],
+                           cancel: Optional[CancellationToken] = None):
+    """
+    Exact minimum-switch cyclic cage order.
+
+    A cage's plan depends only on its incoming arm, so each cage is an arc
+    incoming -> end on the three arms with that plan's cost. A cyclic day is an
+    Eulerian circuit through one arc per cage plus a closing arc back to the
+    start arm (one switch unless it is a loop), which turns the ordering into a
+    choice of arcs solved by `_arc_order_dp` for every candidate set of arms.
+    Polynomial in the number of cages; the DP budget starts at zero extra
+    switches and doubles until the optimum is proven.
+
+    Returns (start_arm, cage_sequence, chosen_plans, total_cost).
+    """
+    base = {c: min(plans[c][s]['cost'] for s in (1, 2, 3)) for c in cage_names}
+    base_total = sum(base.values())
+
+    candidates = []
+    for size in (1, 2, 3):
+        for arms in combinations((1, 2, 3), size):
+            unit_cages, units = [], []
+            fixed_cost, fixed = 0, {}
+            for c in cage_names:
+                options = [(s, plans[c][s]['end'], plans[c][s]['cost'] - base[c])
+                           for s in arms if plans[c][s]['end'] in arms]
+                if not options:
+                    break
+                if size == 1 or all(s == e for s, e, _ in options):
+                    # Loops never move the DP state, so pick the cheapest now.
+                    s, _, cost = min(options, key=lambda opt: opt[2])
+                    fixed_cost += cost
+                    fixed[c] = s
+                else:
+                    unit_cages.append(c)
+                    units.append(options)
+            else:
+                closing = [(u, v, 0 if u == v else 1) for u in arms for v in arms]
+                candidates.append((arms, fixed_cost, fixed, unit_cages, units + [closing]))
+
+    best = None
+    budget = 0
+    pending = candidates
+    while pending:
+        capped = []
+        for cand in pending:
+            check_cancelled(cancel)
+            arms, fixed_cost, fixed, unit_cages, units = cand
+            if len(arms) == 1:
+                result = (0, [0])
+            else:
+                result = _arc_order_dp(units, arms, budget)
+            if result is None:
+                # Every option costs at most one switch, so a budget of
+                # len(units) prunes nothing and None means infeasible.
+                if budget < len(units):
+                    capped.append(cand)
+                continue
+            cost, picks = result
+            total = base_total + fixed_cost + cost
+            if best is None or total < best[0]:
+                incoming = dict(fixed)
+                for c, options, o in zip(unit_cages, units, picks):
+                    incoming[c] = options[o][0]
+                best = (total, units[-1][picks[-1]][1], incoming)
+        if best is not None:
+            capped = [cand for cand in capped if base_total + cand[1] + budget + 1 < best[0]]
+        pending = capped
+        budget = 2 * budget + 1
+
+    total, start_arm, incoming = best
+
+    # Hierholzer walk over the chosen arcs, starting from the start arm.
+    outgoing = {s: deque() for s in (1, 2, 3)}
+    for c in cage_names:
+        outgoing[incoming[c]].append(c)
+    stack, walk = [(start_arm, None)], []
+    while stack:
+        arm, cage = stack[-1]
+        if outgoing[arm]:
+            c = outgoing[arm].popleft()
+            stack.append((plans[c][arm]['end'], c))
+        else:
+            stack.pop()
+            if cage is not None:
+                walk.append(cage)
+    walk.reverse()
+
+    chosen = {c: plans[c][incoming[c]] for c in walk}
+    return start_arm, walk, chosen, total
+
+
+def _greedy_cage_order(cage_names: List[Any], plans: Dict[Any, Dict[int, Dict]],
+                       cancel: Optional[CancellationToken] = None):
+    """
+    Nearest-cage heuristic over every start-arm x first-cage pair.
+
+    The cheapest next cage for an incoming arm is read from one queue per arm,
+    pre-sorted by (cost, tie-break rank), with a per-pass cursor that skips
+    cages already placed; each pass is O(C) after an O(C log C) sort.
+    Ties go to the cage listed first in `cage_names`, so the order is the
+    same in every process whatever its string hash seed.
+
+    Returns (start_arm, cage_sequence, chosen_plans, total_cost).
+    """
+    rank = {c: i for i, c in enumerate(cage_names)}
+    queues = {s: sorted(cage_names, key=lambda ck: (plans[ck][s]['cost'], rank[ck])) for s in (1, 2, 3)}
 
     best_total = None
     best_solution = None
 
     for start_arm in (1, 2, 3):
         for first_cage in cage_names:
-            remaining = set(cage_names)
+            check_cancelled(cancel)
+            placed = set()
+            cursor = {1: 0, 2: 0, 3: 0}
             seq = []
             chosen = {}
             prev_end = start_arm
             total_cost = 0
 
             current = first_cage
-            while remaining:
+            while len(seq) < len(cage_names):
                 if current is None:
-                    current = min(remaining, key=lambda ck: plans[ck][prev_end]['cost'])
+                    queue = queues[prev_end]
+                    i = cursor[prev_end]
+                    while queue[i] in placed:
+                        i += 1
+                    cursor[prev_end] = i
+                    current = queue[i]
                 plan = plans[current][prev_end]
                 total_cost += plan['cost']
                 seq.append(current)
                 chosen[current] = plan
-                remaining.remove(current)
+                placed.add(current)
                 prev_end = plan['end']
                 current = None
 
@@ -213,9 +782,27 @@ def build_nonlearning_plan_cage_packs(animal_data: List[Dict], learning_exit_map
 
             if best_total is None or total_cost < best_total:
                 best_total = total_cost
-                best_solution = (start_arm, seq, chosen)
+                best_solution = (start_arm, seq, chosen, total_cost)
 
-    _, cage_sequence, chosen_plans = best_solution
+    return best_solution
+
+
+def build_nonlearning_plan_cage_packs(animal_data: List[Dict], learning_exit_map: Dict[str, int], exact: bool = False,
+                                      cancel: Optional[CancellationToken] = None):
+    """
+    Reorder cages to minimize switches on non-learning days.
+
+    `exact=True` uses `solve_cage_order_exact` instead of the greedy search.
+    `cancel` is checked between candidate cage orders.
+    """
+    cages = group_animals_by_cage_in_order(animal_data)
+    cage_names = list(cages.keys())
+
+    plans = plan_all_cages(cages, learning_exit_map)
+    check_cancelled(cancel)
+
+    solver = solve_cage_order_exact if exact else _greedy_cage_order
+    _, cage_sequence, chosen_plans, _ = solver(cage_names, plans, cancel=cancel)
     per_animal_exit = {}
     ordered_animals = []
 
@@ -229,189 +816,2193 @@ def build_nonlearning_plan_cage_packs(animal_data: List[Dict], learning_exit_map
     return ordered_animals, per_animal_exit
 
 
-def generate_pseudorandom_sequence(n_trials: int, armA: int, armB: int, avoid_first: Optional[int] = None) -> List[int]:
+# Cross-request memo of reversal-day plans; 0 disables it.
+REVERSAL_PLAN_CACHE_SIZE = 128
+_reversal_plan_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_reversal_plan_lock = threading.Lock()
+
+
+def cohort_fingerprint(animal_data: List[Dict], fields=("AnimalID", "Cage")) -> str:
+    """Order-sensitive digest of the given animal fields."""
+    h = hashlib.sha256()
+    for a in animal_data:
+        h.update("\x1f".join(str(a[f]) for f in fields).encode())
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+def plan_reversal_day(animal_data: List[Dict], learning_exit_map: Dict[str, int], exact: bool = False,
+                      cancel: Optional[CancellationToken] = None):
     """
-    Generate pseudo-random start-arm sequence with no triple repeats.
+    `build_nonlearning_plan_cage_packs`, memoized across requests.
+
+    The plan uses no randomness and depends only on cage order, animal order
+    and learning exits, so it is keyed by a cohort fingerprint plus the exit
+    map. Cached entries are stored as row indices and reattached to the
+    caller's animal dicts.
+    """
+    if REVERSAL_PLAN_CACHE_SIZE <= 0:
+        return build_nonlearning_plan_cage_packs(animal_data, learning_exit_map, exact=exact, cancel=cancel)
+
+    h = hashlib.sha256(cohort_fingerprint(animal_data).encode())
+    h.update(",".join(str(learning_exit_map[a['AnimalID']]) for a in animal_data).encode())
+    key = (h.hexdigest(), exact)
+
+    with _reversal_plan_lock:
+        hit = _reversal_plan_cache.get(key)
+        if hit is not None:
+            _reversal_plan_cache.move_to_end(key)
+    if hit is None:
+        ordered_animals, per_animal_exit = build_nonlearning_plan_cage_packs(animal_data, learning_exit_map,
+                                                                             exact=exact, cancel=cancel)
+        position = {id(a): i for i, a in enumerate(animal_data)}
+        hit = (tuple(position[id(a)] for a in ordered_animals),
+               tuple(per_animal_exit[a['AnimalID']] for a in ordered_animals))
+        with _reversal_plan_lock:
+            _reversal_plan_cache[key] = hit
+            while len(_reversal_plan_cache) > REVERSAL_PLAN_CACHE_SIZE:
+                _reversal_plan_cache.popitem(last=False)
+
+    order, exits = hit
+    ordered_animals = [animal_data[i] for i in order]
+    return ordered_animals, {a['AnimalID']: e for a, e in zip(ordered_animals, exits)}
+
+
+class InfeasibleSequenceError(ValueError):
+    """Raised when no start-arm sequence satisfies the trial constraints."""
+
+
+def count_valid_sequences(max_a: int, max_b: int) -> List[List[List[List[int]]]]:
     """
-    countA, countB = n_trials // 2, n_trials // 2
-    if n_trials % 2 == 1:
-        if random.random() < 0.5:
-            countA += 1
+    Counting DP for balanced A/B sequences with no triple repeats.
+
+    counts[a][b][last][run] is the number of valid ways to place `a` more A's
+    (symbol 0) and `b` more B's (symbol 1) after a run of `run` (1 or 2)
+    copies of symbol `last`. Counts do not depend on the sequence length, so
+    one table serves every allocation up to (max_a, max_b).
+    """
+    counts = [[[[0, 0, 0], [0, 0, 0]] for _ in range(max_b + 1)] for _ in range(max_a + 1)]
+    for total in range(max_a + max_b + 1):
+        for a in range(max(0, total - max_b), min(max_a, total) + 1):
+            b = total - a
+            for last in (0, 1):
+                for run in (1, 2):
+                    if a == 0 and b == 0:
+                        counts[a][b][last][run] = 1
+                        continue
+                    n = 0
+                    if a > 0 and not (last == 0 and run == 2):
+                        n += counts[a - 1][b][0][run + 1 if last == 0 else 1]
+                    if b > 0 and not (last == 1 and run == 2):
+                        n += counts[a][b - 1][1][run + 1 if last == 1 else 1]
+                    counts[a][b][last][run] = n
+    return counts
+
+
+def sample_sequence_template(counts, count_a: int, count_b: int, forbid_first: Optional[int] = None,
+                             rng: Optional[RandomSource] = None) -> List[int]:
+    """
+    Draw one valid 0/1 template uniformly from `counts` in O(count_a + count_b).
+
+    `forbid_first` (0 or 1) excludes that symbol from the first position.
+    """
+    rng = as_python_rng(rng)
+    a, b = count_a, count_b
+    if a + b == 0:
+        return []
+
+    weights = [0, 0]
+    if a > 0 and forbid_first != 0:
+        weights[0] = counts[a - 1][b][0][1]
+    if b > 0 and forbid_first != 1:
+        weights[1] = counts[a][b - 1][1][1]
+    if weights[0] + weights[1] == 0:
+        raise InfeasibleSequenceError(
+            f"No start-arm sequence with {count_a}/{count_b} trials avoids a triple repeat"
+            + (" and the forbidden first arm." if forbid_first is not None else ".")
+        )
+
+    seq = []
+    last, run = None, 0
+    while a + b > 0:
+        if last is not None:
+            weights = [0, 0]
+            if a > 0 and not (last == 0 and run == 2):
+                weights[0] = counts[a - 1][b][0][run + 1 if last == 0 else 1]
+            if b > 0 and not (last == 1 and run == 2):
+                weights[1] = counts[a][b - 1][1][run + 1 if last == 1 else 1]
+        sym = 0 if rng.randrange(weights[0] + weights[1]) < weights[0] else 1
+        run = run + 1 if sym == last else 1
+        last = sym
+        if sym == 0:
+            a -= 1
         else:
-            countB += 1
-
-    pool = [armA] * countA + [armB] * countB
-    random.shuffle(pool)
-
-    def valid(seq):
-        return len(seq) < 3 or not (seq[-1] == seq[-2] == seq[-3])
-
-    def backtrack(cur, items):
-        if not items:
-            return cur
-        for i, cand in enumerate(items):
-            if avoid_first is not None and len(cur) == 0 and cand == avoid_first:
-                continue
-            new = cur + [cand]
-            if valid(new):
-                out = backtrack(new, items[:i] + items[i+1:])
-                if out is not None:
-                    return out
-        return None
-
-    seq = backtrack([], pool)
-    return seq if seq else pool
+            b -= 1
+        seq.append(sym)
+    return seq
+
+
+class SequenceTemplateSampler:
+    """
+    Abstract A/B start-arm templates for one trial count.
+
+    The counting table only depends on `n_trials`, so it is built once per
+    request and each animal's template is relabelled to concrete arms. Draws
+    walk the table one trial at a time, consuming the generator exactly like
+    `sample_sequence_template` in the desktop app (code.py), so a seed gives
+    the same schedule in both.
+    """
+
+    def __init__(self, n_trials: int):
+        self.n_trials = n_trials
+        half, extra = n_trials // 2, n_trials % 2
+        self.counts = count_valid_sequences(half + extra, half + extra)
+        if extra:
+            self.allocations = [(half + 1, half), (half, half + 1)]
+        else:
+            self.allocations = [(half, half)]
+        self._probabilities = None
+
+    def probability_table(self) -> np.ndarray:
+        """Per-state probability of drawing A, for the batch engine."""
+        if self._probabilities is None:
+            max_count = len(self.counts) - 1
+            self._probabilities = template_probability_table(self.counts, max_count, max_count)
+        return self._probabilities
+
+    def sample(self, forbid_first: Optional[int] = None, rng: Optional[RandomSource] = None) -> List[int]:
+        """Draw one 0/1 template, applying the odd-trial coin flip."""
+        rng = as_python_rng(rng)
+        allocations = self.allocations
+        if len(allocations) == 2 and rng.random() >= 0.5:
+            allocations = allocations[::-1]
+
+        # The odd-trial coin flip only falls back to the other balance when the
+        # first-arm constraint makes the drawn one impossible.
+        for i, alloc in enumerate(allocations):
+            try:
+                return sample_sequence_template(self.counts, *alloc, forbid_first, rng=rng)
+            except InfeasibleSequenceError:
+                if i == len(allocations) - 1:
+                    raise
+
+    def sequence(self, armA: int, armB: int, avoid_first: Optional[int] = None,
+                 rng: Optional[RandomSource] = None) -> List[int]:
+        """Draw a template and map symbols 0/1 to `armA`/`armB`."""
+        template = self.sample({armA: 0, armB: 1}.get(avoid_first), rng)
+        arms = (armA, armB)
+        return [arms[sym] for sym in template]
+
+
+def generate_pseudorandom_sequence(n_trials: int, armA: int, armB: int, avoid_first: Optional[int] = None,
+                                   rng: Optional[RandomSource] = None) -> List[int]:
+    """
+    Generate pseudo-random start-arm sequence with no triple repeats.
+
+    The sequence is drawn uniformly among all valid sequences for the chosen
+    balance; raises InfeasibleSequenceError when no valid sequence exists.
+    Callers drawing many sequences should reuse a SequenceTemplateSampler.
+    """
+    return SequenceTemplateSampler(n_trials).sequence(armA, armB, avoid_first, rng)
 
 
-def generate_day_tables(animal_data: List[Dict], learning_days: int, reversal_days: int, n_trials: int, exit_arm_map: Dict[str, int]):
+# Row-state encoding for the batch engine: `last` 2 means "no trial placed yet".
+_NO_LAST = 2
+# OTHER_ARMS[exit] -> (armA, armB), the two start arms left once `exit` is excluded.
+OTHER_ARMS = np.array([[0, 0], [2, 3], [1, 3], [1, 2]], dtype=np.int8)
+DAY_HEADER_PREFIX = ["AnimalID", "Tag", "Sex", "Genotype", "Cage", "ExitArm"]
+
+
+def template_probability_table(counts, max_a: int, max_b: int) -> np.ndarray:
     """
-    Build per-day tables for learning and reversal days.
+    p[a, b, last, run] = probability that the next symbol is A (0) under the
+    uniform distribution over valid completions, for the batch sampler.
+    """
+    p = np.zeros((max_a + 1, max_b + 1, 3, 3), dtype=np.float64)
+    for a in range(max_a + 1):
+        for b in range(max_b + 1):
+            for last, run in ((0, 1), (0, 2), (1, 1), (1, 2), (_NO_LAST, 0)):
+                w_a = w_b = 0
+                if a > 0 and not (last == 0 and run == 2):
+                    w_a = counts[a - 1][b][0][run + 1 if last == 0 else 1]
+                if b > 0 and not (last == 1 and run == 2):
+                    w_b = counts[a][b - 1][1][run + 1 if last == 1 else 1]
+                if w_a + w_b:
+                    p[a, b, last, run] = w_a / (w_a + w_b)
+    return p
+
+
+def sample_templates_batch(sampler: SequenceTemplateSampler, forbid_first: np.ndarray,
+                           rng: Optional[np.random.Generator], uniforms: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Draw one 0/1 template per cell, vectorized across cells.
+
+    `forbid_first` holds 0/1 for a constrained first symbol or -1 for none.
+    Draws come from `rng`, or from `uniforms` (shape (cells, n_trials + 1):
+    the odd-trial coin, then one per trial) so each cell can bring its own
+    keyed stream. Returns an int8 array of shape (cells, n_trials).
+    """
+    n_cells = forbid_first.shape[0]
+    n = sampler.n_trials
+    half, extra = n // 2, n % 2
+    p = sampler.probability_table()
+    counts = sampler.counts
+
+    count_a = np.full(n_cells, half, dtype=np.int64)
+    if extra:
+        # Odd-trial coin flip, falling back to the other balance when the
+        # first-arm constraint rules the drawn one out.
+        more_a = (rng.random(n_cells) if uniforms is None else uniforms[:, 0]) < 0.5
+        ok_a = _allocation_feasible(counts, half + 1, half, forbid_first)
+        ok_b = _allocation_feasible(counts, half, half + 1, forbid_first)
+        more_a = np.where(more_a, ok_a | ~ok_b, ~ok_b)
+        infeasible = ~(ok_a | ok_b)
+        count_a += more_a
+    else:
+        infeasible = ~_allocation_feasible(counts, half, half, forbid_first)
+    if infeasible.any():
+        raise InfeasibleSequenceError(
+            f"No start-arm sequence with {n} trials avoids a triple repeat and the forbidden first arm."
+        )
+    count_b = n - count_a
+
+    out = np.empty((n_cells, n), dtype=np.int8)
+    last = np.full(n_cells, _NO_LAST, dtype=np.int64)
+    run = np.zeros(n_cells, dtype=np.int64)
+    for t in range(n):
+        prob_a = p[count_a, count_b, last, run]
+        if t == 0:
+            prob_a = np.where(forbid_first == 0, 0.0, np.where(forbid_first == 1, 1.0, prob_a))
+        draw = rng.random(n_cells) if uniforms is None else uniforms[:, t + 1]
+        sym = (draw >= prob_a).astype(np.int8)
+        out[:, t] = sym
+        run = np.where(sym == last, run + 1, 1)
+        last = sym.astype(np.int64)
+        count_a -= sym == 0
+        count_b -= sym == 1
+    return out
+
+
+def _allocation_feasible(counts, count_a: int, count_b: int, forbid_first: np.ndarray) -> np.ndarray:
+    """Per-cell flag: does any valid template exist for this allocation?"""
+    w_a = counts[count_a - 1][count_b][0][1] if count_a > 0 else 0
+    w_b = counts[count_a][count_b - 1][1][1] if count_b > 0 else 0
+    return ((w_a > 0) & (forbid_first != 0)) | ((w_b > 0) & (forbid_first != 1))
+
+
+def _forbid_first_symbol(avoid: np.ndarray, arm_a: np.ndarray, arm_b: np.ndarray) -> np.ndarray:
+    """Template symbol (0 = arm A, 1 = arm B) each row may not start with, or -1."""
+    return np.where(avoid == arm_a, 0, np.where(avoid == arm_b, 1, -1)).astype(np.int8)
+
+
+def generate_schedule_arrays(animal_data: List[Dict], learning_days: int, reversal_days: int, n_trials: int,
+                             exit_arm_map: Dict[str, int], rng: Optional[RandomSource] = None,
+                             exact_cage_order: bool = False,
+                             cancel: Optional[CancellationToken] = None) -> Dict[str, Any]:
+    """
+    Batch engine: every start-arm sequence of the schedule in one pass.
+
+    Returns a dict of arrays indexed [day, row]:
+      order  - int32 index into `animal_data` for each row of the day
+      exit   - int8 exit arm of each row
+      trials - int8 start arms, shape [days, animals, n_trials]
+    plus `types`, the Learning/Reversal label of each day. With a
+    KeyedRandom, each cell draws from its own (seed, day, AnimalID) stream.
+    `cancel` is checked between the planning and sampling stages.
+    """
+    check_cancelled(cancel)
+    keyed = rng if isinstance(rng, KeyedRandom) else None
+    rng = None if keyed else as_numpy_rng(rng)
+
+    total_days = learning_days + reversal_days
+    n_animals = len(animal_data)
+    index_of = {a['AnimalID']: i for i, a in enumerate(animal_data)}
+    learning_exit = np.array([exit_arm_map[a['AnimalID']] for a in animal_data], dtype=np.int8)
+
+    order = np.empty((total_days, n_animals), dtype=np.int32)
+    exits = np.empty((total_days, n_animals), dtype=np.int8)
+    order[:learning_days] = np.arange(n_animals, dtype=np.int32)
+    exits[:learning_days] = learning_exit
+    if reversal_days:
+        # The reversal plan is deterministic, so every reversal day shares it.
+        animals_rev, per_animal_exit = plan_reversal_day(list(animal_data), exit_arm_map, exact=exact_cage_order,
+                                                         cancel=cancel)
+        order[learning_days:] = [index_of[a['AnimalID']] for a in animals_rev]
+        exits[learning_days:] = [per_animal_exit[a['AnimalID']] for a in animals_rev]
+
+    arms = OTHER_ARMS[exits]
+    arm_a, arm_b = arms[..., 0], arms[..., 1]
+    # Learning days avoid today's exit, which is never a start arm; reversal
+    # days avoid the learning exit, which always is one.
+    avoid = learning_exit[order]
+    forbid_first = _forbid_first_symbol(avoid, arm_a, arm_b)
+    forbid_first[:learning_days] = -1
+
+    check_cancelled(cancel)
+    sampler = SequenceTemplateSampler(n_trials)
+    uniforms = None
+    if keyed is not None:
+        cell_days = np.repeat(np.arange(total_days), n_animals)
+        cell_ids = [animal_data[i]['AnimalID'] for i in order.ravel()]
+        uniforms = keyed.uniforms(cell_days, cell_ids, n_trials + 1)
+    templates = sample_templates_batch(sampler, forbid_first.ravel(), rng, uniforms)
+    templates = templates.reshape(total_days, n_animals, n_trials)
+    trials = np.where(templates == 0, arm_a[..., None], arm_b[..., None]).astype(np.int8)
+
+    return {
+        "order": order,
+        "exit": exits,
+        "trials": trials,
+        "types": ["Learning" if d < learning_days else "Reversal" for d in range(total_days)],
+    }
+
+
+def iter_day_tables_from_arrays(animal_data: List[Dict], arrays: Dict[str, Any],
+                                cancel: Optional[CancellationToken] = None) -> Iterator[Dict]:
+    """Row/header view of `generate_schedule_arrays` output, one day at a time."""
+    n_trials = arrays["trials"].shape[2]
+    header = DAY_HEADER_PREFIX + [f"T{i+1}" for i in range(n_trials)]
+    meta = [[a['AnimalID'], a['Tag'], a['Sex'], a['Genotype'], a['Cage']] for a in animal_data]
+
+    for d, day_type in enumerate(arrays["types"]):
+        check_cancelled(cancel)
+        order = arrays["order"][d].tolist()
+        exits = arrays["exit"][d].tolist()
+        trials = arrays["trials"][d].tolist()
+        yield {
+            "day": d + 1,
+            "type": day_type,
+            "header": list(header),
+            "rows": [meta[i] + [e] + t for i, e, t in zip(order, exits, trials)]
+        }
+
+
+def day_tables_from_arrays(animal_data: List[Dict], arrays: Dict[str, Any]) -> List[Dict]:
+    """Row/header view of `generate_schedule_arrays` output."""
+    return list(iter_day_tables_from_arrays(animal_data, arrays))
+
+
+def columnar_from_day_tables(day_tables: List[Dict]) -> Dict[str, Any]:
+    """
+    Compact columnar view of day tables.
+
+    Animal metadata is sent once as column arrays; each day carries only the
+    row order (indices into the animal table), exit arms and the trials
+    matrix.
+    """
+    animals: Dict[str, List[Any]] = {col: [] for col in ANIMAL_FIELDS}
+    index: Dict[Any, int] = {}
+    n_meta = len(ANIMAL_FIELDS)
+    days = []
+    for table in day_tables:
+        order, exits, trials = [], [], []
+        for row in table['rows']:
+            idx = index.get(row[0])
+            if idx is None:
+                idx = index[row[0]] = len(index)
+                for col, value in zip(ANIMAL_FIELDS, row[:n_meta]):
+                    animals[col].append(value)
+            order.append(idx)
+            exits.append(row[n_meta])
+            trials.append(row[n_meta + 1:])
+        days.append({"day": table['day'], "type": table['type'],
+                     "order": order, "exit": exits, "trials": trials})
+
+    n_trials = len(day_tables[0]['header']) - len(DAY_HEADER_PREFIX) if day_tables else 0
+    return {"animals": animals, "n_trials": n_trials, "days": days}
+
+
+def columnar_from_arrays(arrays: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    `columnar_from_day_tables` straight from `generate_schedule_arrays` output.
+
+    Expects the arrays plus the `animal_data` they index into. Per-day fields
+    stay NumPy arrays, which `dumps_json` encodes without a Python pass over
+    the rows.
+    """
+    animal_data = arrays["animal_data"]
+    animals = {col: [a[col] for a in animal_data] for col in ANIMAL_FIELDS}
+    days = [{"day": d + 1, "type": day_type, "order": arrays["order"][d], "exit": arrays["exit"][d],
+             "trials": arrays["trials"][d]}
+            for d, day_type in enumerate(arrays["types"])]
+    return {"animals": animals, "n_trials": int(arrays["trials"].shape[2]), "days": days}
+
+
+def _sequential_day_rows(animals_today: List[Dict], per_day_exit: Dict[str, int], exit_arm_map: Dict[str, int],
+                         in_learning: bool, sampler: SequenceTemplateSampler, rng) -> List[List[Any]]:
+    """One day's rows from the per-animal sampler, in `animals_today` order."""
+    rows = []
+    for animal in animals_today:
+        aid = animal['AnimalID']
+        exit_arm_today = per_day_exit[aid]
+
+        other = [1, 2, 3]
+        other.remove(exit_arm_today)
+        armA, armB = other
+
+        avoid_first = exit_arm_today if in_learning else exit_arm_map[aid]
+
+        seq = sampler.sequence(armA, armB, avoid_first=avoid_first, rng=rng)
+        row = [aid, animal['Tag'], animal['Sex'], animal['Genotype'], animal['Cage'], exit_arm_today] + seq
+        rows.append(row)
+    return rows
+
+
+def iter_day_tables(animal_data: List[Dict], learning_days: int, reversal_days: int, n_trials: int,
+                    exit_arm_map: Dict[str, int], batch: bool = False, exact_cage_order: bool = False,
+                    rng: Optional[RandomSource] = None,
+                    cancel: Optional[CancellationToken] = None) -> Iterator[Dict]:
+    """
+    Build per-day tables for learning and reversal days, yielding each day as it completes.
+
+    With `batch=True` all sequences come from the vectorized engine and the
+    tables are a view over `generate_schedule_arrays`. `exact_cage_order`
+    plans reversal days with the exact cage-order solver. All draws come from
+    `rng` (a `random.Random` or `numpy.random.Generator`), so concurrent
+    schedules with their own generators stay reproducible. A KeyedRandom
+    always goes through the batch engine, so keyed schedules are identical
+    whichever engine was requested. `cancel` is checked before each day and
+    between cage plans; once set, ScheduleCancelledError is raised.
     """
     total_days = learning_days + reversal_days
     if total_days <= 0:
-        return []
-
+        return
+    if batch or isinstance(rng, KeyedRandom):
+        arrays = generate_schedule_arrays(animal_data, learning_days, reversal_days, n_trials, exit_arm_map,
+                                          rng=rng, exact_cage_order=exact_cage_order, cancel=cancel)
+        yield from iter_day_tables_from_arrays(animal_data, arrays, cancel=cancel)
+        return
+
+    rng = as_python_rng(rng)
     base_order_animals = list(animal_data)
-    day_tables = []
+    sampler = SequenceTemplateSampler(n_trials)
+    # Reversal days all share one deterministic plan; compute it once.
+    reversal_plan = None
 
     for d in range(total_days):
+        check_cancelled(cancel)
         in_learning = d < learning_days
-        header = ["AnimalID", "Tag", "Sex", "Genotype", "Cage", "ExitArm"] + [f"T{i+1}" for i in range(n_trials)]
-        rows = []
+        header = DAY_HEADER_PREFIX + [f"T{i+1}" for i in range(n_trials)]
 
         if in_learning:
             animals_today = base_order_animals
             per_day_exit = {a['AnimalID']: exit_arm_map[a['AnimalID']] for a in animals_today}
         else:
-            animals_today, per_day_exit = build_nonlearning_plan_cage_packs(base_order_animals, exit_arm_map)
+            if reversal_plan is None:
+                reversal_plan = plan_reversal_day(base_order_animals, exit_arm_map, exact=exact_cage_order,
+                                                  cancel=cancel)
+            animals_today, per_day_exit = reversal_plan
 
-        for animal in animals_today:
-            aid = animal['AnimalID']
-            exit_arm_today = per_day_exit[aid]
+        rows = _sequential_day_rows(animals_today, per_day_exit, exit_arm_map, in_learning, sampler, rng)
 
-            other = [1, 2, 3]
-            other.remove(exit_arm_today)
-            armA, armB = other
-
-            avoid_first = exit_arm_today if in_learning else exit_arm_map[aid]
-
-            seq = generate_pseudorandom_sequence(n_trials, armA, armB, avoid_first=avoid_first)
-            row = [aid, animal['Tag'], animal['Sex'], animal['Genotype'], animal['Cage'], exit_arm_today] + seq
-            rows.append(row)
-
-        day_tables.append({
+        yield {
             "day": d + 1,
             "type": "Learning" if in_learning else "Reversal",
             "header": header,
             "rows": rows
-        })
+        }
 
-    return day_tables
 
+PARALLEL_DAYS_MIN_CELLS = 200_000
 
-# ==================== API ENDPOINTS ====================
 
-@app.post("/generate-schedule")
-async def generate_schedule(request: ScheduleRequest):
-    """
-    Generate Y-maze schedule based on input parameters.
-    """
-    try:
-        # Seed for reproducibility when provided
-        if request.seed is not None:
-            random.seed(request.seed)
+def generate_day_shard(animal_data: List[Dict], days: List[int], learning_days: int, n_trials: int,
+                       exit_arm_map: Dict[str, int], reversal_plan, batch: bool = False,
+                       day_seeds: Optional[List[int]] = None, keyed_seed: Optional[int] = None,
+                       cancel: Optional[CancellationToken] = None) -> List[Dict]:
+    """
+    Day tables for a subset of days, each drawn from its own generator.
 
-        # Convert Pydantic models to dicts or load example data
-        if request.use_example or not request.animals:
-            try:
-                animal_data = load_example_animals()
-            except FileNotFoundError as e:
-                raise HTTPException(status_code=400, detail=str(e))
+    Day d uses `random.Random(day_seeds[d])` (or a NumPy generator with that
+    seed when `batch`), or the keyed per-cell streams when `keyed_seed` is
+    given, so a day's table does not depend on which shard builds it.
+    Module-level so it can run in a worker process; `cancel` is checked
+    before each day.
+    """
+    sampler = SequenceTemplateSampler(n_trials)
+    header = DAY_HEADER_PREFIX + [f"T{i+1}" for i in range(n_trials)]
+    keyed = KeyedRandom(keyed_seed) if keyed_seed is not None else None
+    tables = []
+    for d in days:
+        check_cancelled(cancel)
+        in_learning = d < learning_days
+        if in_learning:
+            animals_today = animal_data
+            per_day_exit = exit_arm_map
         else:
-            animal_data = [animal.dict() for animal in request.animals]
+            animals_today, per_day_exit = reversal_plan
 
-        if not animal_data:
-            raise HTTPException(status_code=400, detail="No animals provided.")
+        if keyed is None and not batch:
+            rows = _sequential_day_rows(animals_today, per_day_exit, exit_arm_map, in_learning, sampler,
+                                        random.Random(day_seeds[d]))
+        else:
+            ids = [a['AnimalID'] for a in animals_today]
+            exits = np.array([per_day_exit[aid] for aid in ids], dtype=np.int8)
+            arms = OTHER_ARMS[exits]
+            arm_a, arm_b = arms[:, 0], arms[:, 1]
+            forbid_first = _forbid_first_symbol(np.array([exit_arm_map[aid] for aid in ids], dtype=np.int8),
+                                                arm_a, arm_b)
+            if in_learning:
+                forbid_first[:] = -1
+            if keyed is not None:
+                templates = sample_templates_batch(sampler, forbid_first, None,
+                                                   keyed.uniforms(np.full(len(ids), d), ids, n_trials + 1))
+            else:
+                templates = sample_templates_batch(sampler, forbid_first, np.random.default_rng(day_seeds[d]))
+            trials = np.where(templates == 0, arm_a[:, None], arm_b[:, None]).tolist()
+            rows = [[a['AnimalID'], a['Tag'], a['Sex'], a['Genotype'], a['Cage'], int(e)] + t
+                    for a, e, t in zip(animals_today, exits.tolist(), trials)]
+
+        tables.append({
+            "day": d + 1,
+            "type": "Learning" if in_learning else "Reversal",
+            "header": list(header),
+            "rows": rows
+        })
+    return tables
+
+
+def iter_day_tables_parallel(animal_data: List[Dict], learning_days: int, reversal_days: int, n_trials: int,
+                             exit_arm_map: Dict[str, int], batch: bool = False, exact_cage_order: bool = False,
+                             rng: Optional[RandomSource] = None, pool=None, workers: int = 1,
+                             cancel: Optional[CancellationToken] = None) -> Iterator[Dict]:
+    """
+    Day-sharded variant of `iter_day_tables`.
+
+    Per-day seeds are drawn from `rng` up front (keyed schedules need none),
+    then contiguous blocks of days are built on `pool`. The output is the
+    same for any worker count, including the serial fallback used without a
+    pool, with one worker or for schedules under PARALLEL_DAYS_MIN_CELLS.
+    """
+    total_days = learning_days + reversal_days
+    if total_days <= 0:
+        return
+    reversal_plan = None
+    if reversal_days:
+        reversal_plan = plan_reversal_day(list(animal_data), exit_arm_map, exact=exact_cage_order, cancel=cancel)
+    if isinstance(rng, KeyedRandom):
+        shard_kwargs = {"batch": batch, "keyed_seed": rng.seed, "cancel": cancel}
+    else:
+        py_rng = as_python_rng(rng)
+        shard_kwargs = {"batch": batch, "day_seeds": [py_rng.getrandbits(64) for _ in range(total_days)],
+                        "cancel": cancel}
+    args = (animal_data, learning_days, n_trials, exit_arm_map, reversal_plan)
 
-        # Generate balanced exit arms
-        exit_arm_map = assign_balanced_exit_arms(animal_data)
+    small = len(animal_data) * total_days * n_trials < PARALLEL_DAYS_MIN_CELLS
+    if pool is None or workers <= 1 or total_days == 1 or small:
+        for d in range(total_days):
+            yield from generate_day_shard(args[0], [d], *args[1:], **shard_kwargs)
+        return
 
-        # Generate day tables
-        day_tables = generate_day_tables(
-            animal_data,
-            request.learning_days,
-            request.reversal_days,
-            request.trials_per_day,
-            exit_arm_map
-        )
+    shards = [block.tolist() for block in np.array_split(np.arange(total_days), min(workers, total_days))]
+    futures = [pool.submit(generate_day_shard, args[0], shard, *args[1:], **shard_kwargs) for shard in shards]
+    try:
+        for future in futures:
+            check_cancelled(cancel)
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
 
-        return {
-            "success": True,
-            "exit_arm_map": exit_arm_map,
-            "day_tables": day_tables
-        }
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
+def generate_day_tables(animal_data: List[Dict], learning_days: int, reversal_days: int, n_trials: int,
+                        exit_arm_map: Dict[str, int], batch: bool = False, exact_cage_order: bool = False,
+                        rng: Optional[RandomSource] = None) -> List[Dict]:
+    """All per-day tables at once; see `iter_day_tables`."""
+    return list(iter_day_tables(animal_data, learning_days, reversal_days, n_trials, exit_arm_map,
+                                batch=batch, exact_cage_order=exact_cage_order, rng=rng))
+
+
+class ScheduleInputError(ValueError):
+    """Raised when a schedule request has no usable animals."""
+
+
+def request_animals(request: ScheduleRequest) -> List[Dict[str, Any]]:
+    """Animal dicts for a request, falling back to the bundled example data."""
+    if request.use_example or not request.animals:
+        try:
+            animal_data = load_example_animals()
+        except FileNotFoundError as e:
+            raise ScheduleInputError(str(e))
+    elif isinstance(request.animals, AnimalColumns):
+        animal_data = request.animals.to_records()
+    else:
+        animal_data = [animal.dict() for animal in request.animals]
+
+    if not animal_data:
+        raise ScheduleInputError("No animals provided.")
+    return animal_data
+
+
+UPLOAD_CHUNK_ROWS = 5000
+
+# Normalized header (lowercase, letters/digits only) -> canonical column
+_HEADER_ALIASES = {
+    "animalid": "AnimalID", "animal": "AnimalID", "id": "AnimalID", "mouseid": "AnimalID",
+    "tag": "Tag", "eartag": "Tag",
+    "sex": "Sex",
+    "genotype": "Genotype", "geno": "Genotype",
+    "cage": "Cage", "cageid": "Cage",
+}
+
+
+def _norm_hyphens(s: str) -> str:
+    # normalize various hyphens to ASCII hyphen-minus
+    return (s.replace("\u2011", "-")  # non-breaking hyphen
+             .replace("\u2013", "-")  # en dash
+             .replace("\u2014", "-")  # em dash
+             .replace("\u2212", "-")  # minus
+             .strip())
+
+
+def _cell_text(value: Any) -> str:
+    """Spreadsheet cell as cleaned text (101.0 -> "101", empty -> "")."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return _norm_hyphens(str(value))
+
+
+def _canonical_columns(header: List[Any]) -> Dict[str, int]:
+    """Map canonical animal fields to their positions in an uploaded header row."""
+    positions: Dict[str, int] = {}
+    for idx, name in enumerate(header):
+        key = re.sub(r"[^a-z0-9]", "", _cell_text(name).lower())
+        field = _HEADER_ALIASES.get(key)
+        if field is not None and field not in positions:
+            positions[field] = idx
+    missing = [f for f in ANIMAL_FIELDS if f not in positions]
+    if missing:
+        raise ScheduleInputError(f"Uploaded file is missing column(s): {', '.join(missing)}")
+    return positions
+
+
+# Tried in order; Excel on Windows saves "CSV" as cp1252 unless told otherwise
+_UPLOAD_ENCODINGS = ("utf-8-sig", "cp1252")
+_SNIFF_BYTES = 64 * 1024
+
+
+def _detect_encoding(stream) -> str:
+    """First of _UPLOAD_ENCODINGS that decodes the whole upload, read in blocks; rewinds `stream`."""
+    for encoding in _UPLOAD_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        stream.seek(0)
+        try:
+            for block in iter(lambda: stream.read(1 << 20), b""):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            continue
+        stream.seek(0)
+        return encoding
+    raise ScheduleInputError("Uploaded file is not UTF-8 or Windows-1252 text.")
+
+
+def _sniff_delimiter(stream, encoding: str, default: str) -> str:
+    """Delimiter (comma, tab or semicolon) guessed from the start of the upload; rewinds `stream`."""
+    sample = stream.read(_SNIFF_BYTES).decode(encoding, errors="ignore")
+    stream.seek(0)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",\t;").delimiter
+    except csv.Error:
+        return default
+
+
+def _iter_csv_chunks(stream, sep: Optional[str], default_sep: str = ",") -> Iterator[List[List[str]]]:
+    """Rows of a delimited text upload; `sep=None` sniffs the delimiter, falling back to `default_sep`."""
+    encoding = _detect_encoding(stream)
+    if sep is None:
+        sep = _sniff_delimiter(stream, encoding, default_sep)
+    try:
+        reader = pd.read_csv(stream, sep=sep, dtype=str, header=None, keep_default_na=False,
+                             encoding=encoding, chunksize=UPLOAD_CHUNK_ROWS)
+        for chunk in reader:
+            yield chunk.values.tolist()
+    except pd.errors.EmptyDataError:
+        return
+    except pd.errors.ParserError as e:
+        detail = str(e).split("C error:")[-1].strip()
+        raise ScheduleInputError(f"Malformed CSV: {detail}")
+
+
+def _iter_xlsx_chunks(stream) -> Iterator[List[List[Any]]]:
+    import openpyxl
+    from openpyxl.utils.exceptions import InvalidFileException
 
-@app.post("/export-excel")
-async def export_excel(request: ScheduleRequest):
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError, OSError):
+        raise ScheduleInputError("Uploaded file is not a valid .xlsx workbook.")
+    try:
+        chunk = []
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            chunk.append(row)
+            if len(chunk) >= UPLOAD_CHUNK_ROWS:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
+
+
+def parse_animal_file(stream, filename: str) -> AnimalColumns:
     """
-    Export schedule to Excel file with separate sheets for each day.
+    Parse an uploaded CSV/TSV/XLSX animal list into columns, chunk by chunk.
+
+    Headers are matched case- and punctuation-insensitively (e.g. "Animal ID",
+    "animal_id"), every cell goes through `_norm_hyphens`, blank rows are
+    skipped and rows with an AnimalID but no Cage are rejected. Text files
+    may be UTF-8 or Windows-1252; `.txt` and extensionless uploads have
+    their delimiter sniffed. Malformed files raise ScheduleInputError.
     """
-    try:
-        if request.seed is not None:
-            random.seed(request.seed)
+    suffix = Path(filename or "").suffix.lower()
+    if suffix in (".xlsx", ".xlsm"):
+        chunks = _iter_xlsx_chunks(stream)
+    elif suffix in (".csv", ".tsv", ".txt", ""):
+        chunks = _iter_csv_chunks(stream, {".csv": ",", ".tsv": "\t"}.get(suffix),
+                                  default_sep="\t" if suffix == ".txt" else ",")
+    else:
+        raise ScheduleInputError(f"Unsupported file type '{suffix}'; upload .csv, .tsv or .xlsx.")
 
-        if request.use_example or not request.animals:
-            try:
-                animal_data = load_example_animals()
-            except FileNotFoundError as e:
-                raise HTTPException(status_code=400, detail=str(e))
-        else:
-            animal_data = [animal.dict() for animal in request.animals]
+    columns: Dict[str, List[str]] = {f: [] for f in ANIMAL_FIELDS}
+    positions = None
+    row_num = 0
+    for chunk in chunks:
+        for row in chunk:
+            row_num += 1
+            if positions is None:
+                if not any(_cell_text(v) for v in row):
+                    continue
+                positions = _canonical_columns(list(row))
+                continue
+            values = {f: _cell_text(row[i]) if i < len(row) else "" for f, i in positions.items()}
+            if not values["AnimalID"]:
+                continue
+            if not values["Cage"]:
+                raise ScheduleInputError(f"Row {row_num}: animal {values['AnimalID']} has no Cage.")
+            for f in ANIMAL_FIELDS:
+                columns[f].append(values[f])
 
-        if not animal_data:
-            raise HTTPException(status_code=400, detail="No animals provided.")
+    if positions is None:
+        raise ScheduleInputError("Uploaded file is empty.")
+    return AnimalColumns(**columns)
 
-        exit_arm_map = assign_balanced_exit_arms(animal_data)
-        day_tables = generate_day_tables(
-            animal_data,
-            request.learning_days,
-            request.reversal_days,
+
+def derive_cohort_seed(batch_seed: int, index: int) -> int:
+    """Stable 63-bit seed for cohort `index` of a seeded batch."""
+    digest = hashlib.sha256(f"{batch_seed}:{index}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") >> 1
+
+
+def prepare_schedule(request: ScheduleRequest):
+    """Resolve a request's animals, its per-request generator and balanced exit arms."""
+    animal_data = request_animals(request)
+
+    if request.keyed_rng:
+        seed = request.seed if request.seed is not None else random.SystemRandom().getrandbits(63)
+        rng = KeyedRandom(seed)
+        # Assign in AnimalID order so exit arms do not depend on input order
+        ordered = sorted(animal_data, key=lambda a: str(a['AnimalID']))
+        exit_arm_map = assign_balanced_exit_arms(ordered, rng.exit_arm_rng())
+        return animal_data, exit_arm_map, rng
+
+    # Per-request generator: seeded output stays reproducible under load
+    rng = random.Random(request.seed)
+
+    # Generate balanced exit arms
+    exit_arm_map = assign_balanced_exit_arms(animal_data, rng)
+    return animal_data, exit_arm_map, rng
+
+
+def iter_request_days(request: ScheduleRequest, animal_data: List[Dict], exit_arm_map: Dict[str, int],
+                      rng: RandomSource, cancel: Optional[CancellationToken] = None) -> Iterator[Dict]:
+    """`iter_day_tables` with the request's day counts and engine options."""
+    if request.parallel_days:
+        return iter_day_tables_parallel(
+            animal_data,
+            request.learning_days,
+            request.reversal_days,
             request.trials_per_day,
-            exit_arm_map
+            exit_arm_map,
+            batch=request.batch,
+            exact_cage_order=request.exact_cage_order,
+            rng=rng,
+            pool=engine_executor.day_pool(),
+            workers=engine_executor.max_workers,
+            cancel=cancel
+        )
+    return iter_day_tables(
+        animal_data,
+        request.learning_days,
+        request.reversal_days,
+        request.trials_per_day,
+        exit_arm_map,
+        batch=request.batch,
+        exact_cage_order=request.exact_cage_order,
+        rng=rng,
+        cancel=cancel
+    )
+
+
+def compute_schedule(request: ScheduleRequest, cancel: Optional[CancellationToken] = None) -> Dict[str, Any]:
+    """
+    Run the whole scheduling pipeline for one request.
+
+    Synchronous and self-contained so it can run in a worker thread or process.
+    Raises ScheduleCancelledError if `cancel` is set before it finishes.
+    Array-engine results also keep their arrays under "arrays" for the
+    columnar view.
+    """
+    animal_data, exit_arm_map, rng = prepare_schedule(request)
+    if uses_array_engine(request) and request.learning_days + request.reversal_days > 0:
+        arrays = generate_schedule_arrays(animal_data, request.learning_days, request.reversal_days,
+                                          request.trials_per_day, exit_arm_map, rng=rng,
+                                          exact_cage_order=request.exact_cage_order, cancel=cancel)
+        result = schedule_result(exit_arm_map, day_tables_from_arrays(animal_data, arrays), rng)
+        result["arrays"] = {**arrays, "animal_data": animal_data}
+        return result
+    day_tables = list(iter_request_days(request, animal_data, exit_arm_map, rng, cancel=cancel))
+    return schedule_result(exit_arm_map, day_tables, rng)
+
+
+def uses_array_engine(request: ScheduleRequest) -> bool:
+    """Whether `compute_schedule` builds the request through `generate_schedule_arrays`."""
+    return (request.batch or request.keyed_rng) and not request.parallel_days
+
+
+def compute_schedule_shared(request: ScheduleRequest, cancel: Optional[CancellationToken] = None) -> Dict[str, Any]:
+    """
+    Worker-process `compute_schedule` that hands the trial tensor back in shared memory.
+
+    Only the small per-animal and per-row parts are pickled; the int8
+    [days, animals, trials] tensor is written to a SharedMemory block whose
+    name is returned. `schedule_from_shared` reads and releases it.
+    Engines that build rows directly return the plain `compute_schedule`
+    record rather than packing the rows into arrays only to unpack them.
+    """
+    if not uses_array_engine(request):
+        return compute_schedule(request, cancel)
+
+    animal_data, exit_arm_map, rng = prepare_schedule(request)
+    arrays = generate_schedule_arrays(animal_data, request.learning_days, request.reversal_days,
+                                      request.trials_per_day, exit_arm_map, rng=rng,
+                                      exact_cage_order=request.exact_cage_order, cancel=cancel)
+
+    trials = arrays.pop("trials")
+    block = shared_memory.SharedMemory(create=True, size=max(trials.nbytes, 1))
+    try:
+        np.ndarray(trials.shape, dtype=np.int8, buffer=block.buf)[...] = trials
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    block.close()
+    if os.name == "posix":
+        # The server process owns and unlinks the block; keep this worker's
+        # resource tracker from reclaiming it when the worker exits.
+        resource_tracker.unregister(block._name, "shared_memory")
+
+    shared = schedule_result(exit_arm_map, [], rng)
+    del shared["day_tables"]
+    shared.update(arrays, animal_data=animal_data, trials_block=block.name, trials_shape=trials.shape)
+    return shared
+
+
+def schedule_from_shared(shared: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the schedule record from `compute_schedule_shared` output and free its block.
+
+    Rebuilding the row lists is CPU-bound; call it off the event loop.
+    """
+    if "trials_block" not in shared:
+        return shared
+    block = shared_memory.SharedMemory(name=shared["trials_block"])
+    try:
+        # One memcpy out of the block; the tensor is kept for the columnar view
+        trials = np.ndarray(shared["trials_shape"], dtype=np.int8, buffer=block.buf).copy()
+    finally:
+        block.close()
+        block.unlink()
+    arrays = {"order": shared["order"], "exit": shared["exit"], "types": shared["types"], "trials": trials}
+    result = {"exit_arm_map": shared["exit_arm_map"],
+              "day_tables": day_tables_from_arrays(shared["animal_data"], arrays)}
+    if "seed" in shared:
+        result["seed"] = shared["seed"]
+    result["arrays"] = {**arrays, "animal_data": shared["animal_data"]}
+    return result
+
+
+def schedule_result(exit_arm_map: Dict[str, int], day_tables: List[Dict], rng: RandomSource) -> Dict[str, Any]:
+    """Computed-schedule record; keyed schedules also keep their seed for cell regeneration."""
+    result = {"exit_arm_map": exit_arm_map, "day_tables": day_tables}
+    if isinstance(rng, KeyedRandom):
+        result["seed"] = rng.seed
+    return result
+
+
+def regenerate_cell(request: ScheduleRequest, day: int, animal_id: str) -> Dict[str, Any]:
+    """
+    Recompute one animal's start arms for one day of a keyed schedule.
+
+    Draws only that cell's (seed, day, AnimalID) stream; matches the
+    corresponding row of the full schedule.
+    """
+    if not request.keyed_rng or request.seed is None:
+        raise ScheduleInputError("Cell regeneration needs a seeded request with keyed_rng enabled.")
+    total_days = request.learning_days + request.reversal_days
+    if not 1 <= day <= total_days:
+        raise ScheduleInputError(f"Day must be between 1 and {total_days}.")
+
+    animal_data, exit_arm_map, rng = prepare_schedule(request)
+    animal = next((a for a in animal_data if str(a['AnimalID']) == animal_id), None)
+    if animal is None:
+        raise ScheduleInputError(f"Unknown AnimalID: {animal_id}")
+
+    learning_exit = exit_arm_map[animal['AnimalID']]
+    in_learning = day <= request.learning_days
+    if in_learning:
+        exit_arm, forbid_first = learning_exit, -1
+    else:
+        _, per_animal_exit = plan_reversal_day(animal_data, exit_arm_map, exact=request.exact_cage_order)
+        exit_arm = per_animal_exit[animal['AnimalID']]
+    arm_a, arm_b = OTHER_ARMS[exit_arm].tolist()
+    if not in_learning:
+        forbid_first = 0 if learning_exit == arm_a else 1 if learning_exit == arm_b else -1
+
+    n_trials = request.trials_per_day
+    uniforms = rng.uniforms([day - 1], [animal['AnimalID']], n_trials + 1)
+    template = sample_templates_batch(SequenceTemplateSampler(n_trials), np.array([forbid_first]), None, uniforms)[0]
+    return {
+        "day": day,
+        "type": "Learning" if in_learning else "Reversal",
+        "seed": request.seed,
+        "row": [animal['AnimalID'], animal['Tag'], animal['Sex'], animal['Genotype'], animal['Cage'], exit_arm]
+               + [arm_a if sym == 0 else arm_b for sym in template.tolist()],
+    }
+
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_XLSX_CONTENT_TYPES_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+)
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+_XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_XLSX_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_XLSX_SHEET_TAIL = '</sheetData></worksheet>'
+_XML_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# Excel also rejects these in sheet names, on top of the XML-illegal ones
+_XLSX_SHEET_NAME_ILLEGAL_CHARS = re.compile(r'[\x00-\x1f\[\]:*?/\\]')
+EXPORT_ROWS_PER_CHUNK = 256
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable write target that hands back whatever zipfile has written so far."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _xlsx_column(idx: int) -> str:
+    """Zero-based column index to an Excel column letter (0 -> A)."""
+    letters = ""
+    idx += 1
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _xlsx_row(values: List[Any], row_num: int, columns: List[str]) -> str:
+    cells = []
+    for value, col in zip(values, columns):
+        if value is None:
+            continue
+        ref = f"{col}{row_num}"
+        if isinstance(value, (bool, np.bool_)):
+            cells.append(f'<c r="{ref}" t="b"><v>{int(value)}</v></c>')
+        elif isinstance(value, (int, float, np.integer, np.floating)):
+            # NaN/inf have no xlsx encoding; leave the cell empty like pandas does
+            if isinstance(value, (float, np.floating)) and not math.isfinite(value):
+                continue
+            cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        else:
+            text = xml_escape(_XML_ILLEGAL_CHARS.sub("", str(value)))
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f'<row r="{row_num}">{"".join(cells)}</row>'
+
+
+def iter_excel_workbook(day_tables: List[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    Stream day tables as an .xlsx workbook, one sheet per day.
+
+    Rows are written straight into the deflated zip entry with inline strings,
+    so memory stays flat in the number of rows and the first bytes are ready
+    after the first chunk of the first sheet.
+    """
+    sink = _ZipSink()
+    sheet_names = [_XLSX_SHEET_NAME_ILLEGAL_CHARS.sub("", f"Day{table['day']}_{table['type']}")[:31]
+                   for table in day_tables]
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        overrides = "".join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, len(day_tables) + 1)
+        )
+        zf.writestr("[Content_Types].xml", _XLSX_CONTENT_TYPES_HEAD + overrides + "</Types>")
+        zf.writestr("_rels/.rels", _XLSX_ROOT_RELS)
+        zf.writestr("xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + "".join(f'<sheet name="{xml_escape(name)}" sheetId="{i}" r:id="rId{i}"/>'
+                      for i, name in enumerate(sheet_names, 1))
+            + '</sheets></workbook>'
+        ))
+        zf.writestr("xl/_rels/workbook.xml.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(f'<Relationship Id="rId{i}" '
+                      'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                      f'Target="worksheets/sheet{i}.xml"/>' for i in range(1, len(day_tables) + 1))
+            + f'<Relationship Id="rId{len(day_tables) + 1}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+            'Target="styles.xml"/></Relationships>'
+        ))
+        zf.writestr("xl/styles.xml", _XLSX_STYLES)
+        yield sink.drain()
+
+        for i, table in enumerate(day_tables, 1):
+            columns = [_xlsx_column(c) for c in range(len(table['header']))]
+            with zf.open(f"xl/worksheets/sheet{i}.xml", "w") as sheet:
+                sheet.write(_XLSX_SHEET_HEAD.encode())
+                sheet.write(_xlsx_row(table['header'], 1, columns).encode())
+                rows = table['rows']
+                for start in range(0, len(rows), EXPORT_ROWS_PER_CHUNK):
+                    chunk = rows[start:start + EXPORT_ROWS_PER_CHUNK]
+                    sheet.write("".join(
+                        _xlsx_row(row, start + j + 2, columns) for j, row in enumerate(chunk)
+                    ).encode())
+                    data = sink.drain()
+                    if data:
+                        yield data
+                sheet.write(_XLSX_SHEET_TAIL.encode())
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _iter_csv_rows(header: Optional[List[Any]], rows: List[List[Any]], prefix=()) -> Iterator[bytes]:
+    """Encode an optional header plus rows (each led by `prefix`) as CSV, chunked by EXPORT_ROWS_PER_CHUNK."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header is not None:
+        writer.writerow(header)
+    for start in range(0, len(rows), EXPORT_ROWS_PER_CHUNK):
+        for row in rows[start:start + EXPORT_ROWS_PER_CHUNK]:
+            writer.writerow(list(prefix) + row)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
+
+
+def iter_csv(day_tables: List[Dict[str, Any]]) -> Iterator[bytes]:
+    """Stream all days as one CSV with a leading Day column, like the desktop app's combined export."""
+    for i, table in enumerate(day_tables):
+        header = ["Day"] + table['header'] if i == 0 else None
+        yield from _iter_csv_rows(header, table['rows'], prefix=(table['day'],))
+
+
+def iter_csv_zip(day_tables: List[Dict[str, Any]]) -> Iterator[bytes]:
+    """Stream a ZIP holding one CSV per day (ymaze_day_{n}.csv)."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for table in day_tables:
+            with zf.open(f"ymaze_day_{table['day']}.csv", "w") as entry:
+                for chunk in _iter_csv_rows(table['header'], table['rows']):
+                    entry.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    yield sink.drain()
+
+
+# ==================== JSON RESPONSES ====================
+
+JSON_BACKEND = "orjson" if orjson is not None else "msgspec" if msgspec is not None else "json"
+
+
+def _json_default(obj):
+    """Encode NumPy scalars/arrays natively and anything else as its string."""
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    return str(obj)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps_json(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_json_default, option=_ORJSON_OPTIONS)
+elif msgspec is not None:
+    _msgspec_encoder = msgspec.json.Encoder(enc_hook=_json_default)
+
+    def dumps_json(obj: Any) -> bytes:
+        return _msgspec_encoder.encode(obj)
+else:
+    def dumps_json(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+dumps_json.__doc__ = f"Serialize plain dicts/lists to compact JSON bytes ({JSON_BACKEND} backend)."
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered by `dumps_json`.
+
+    Return it directly from an endpoint: FastAPI then skips `jsonable_encoder`,
+    which otherwise walks every cell of every day table in Python.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
+
+
+# ==================== ENGINE EXECUTOR ====================
+
+class EngineBusyError(RuntimeError):
+    """Raised when the engine queue is full."""
+
+
+def _warm_engine_worker():
+    """Process-pool initializer: pay import and first-use costs once per worker."""
+    SequenceTemplateSampler(10).probability_table()
+    pd.DataFrame({"x": [0]})
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+class EngineExecutor:
+    """
+    Runs CPU-bound scheduling work off the event loop.
+
+    `kind` is "thread" or "process". At most `max_concurrency` jobs run at
+    once; up to `max_queue` more wait for a slot (0 = unbounded) and further
+    submissions fail with EngineBusyError.
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: Optional[int] = None,
+                 max_concurrency: Optional[int] = None, max_queue: int = 0):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind!r}")
+        self.kind = kind
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_concurrency = max_concurrency or self.max_workers
+        self.max_queue = max_queue
+        self.running = 0
+        self.queued = 0
+        self._executor = None
+        self._process_pool = None
+        self._lock = threading.Lock()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                         initializer=_warm_engine_worker)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix="ymaze-engine")
+            return self._executor
+
+    def _get_process_pool(self):
+        """Process pool for fan-out work; the main pool when it already is one."""
+        if self.kind == "process":
+            return self._get_executor()
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                         initializer=_warm_engine_worker)
+            return self._process_pool
+
+    def warm(self):
+        """Start every process worker now rather than on the first request."""
+        if self.kind != "process":
+            return
+        pool = self._get_executor()
+        for future in [pool.submit(_worker_ready) for _ in range(self.max_workers)]:
+            future.result()
+
+    def cancel_token(self, request: Optional[ScheduleRequest] = None) -> CancellationToken:
+        """Cancellation token for `request`, shared across processes if the work may reach a worker process."""
+        return CancellationToken(shared=self.kind == "process" or bool(request is not None and request.parallel_days))
+
+    async def run_schedule(self, request: ScheduleRequest,
+                           cancel: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """`compute_schedule` on the pool, via shared memory when it is a process pool."""
+        if self.kind == "process":
+            shared = await self.run(compute_schedule_shared, request, cancel)
+            return await run_in_threadpool(schedule_from_shared, shared)
+        return await self.run(compute_schedule, request, cancel)
+
+    def day_pool(self):
+        """
+        Process pool for day shards, or None inside a worker process (no nested pools).
+        """
+        if multiprocessing.parent_process() is not None:
+            return None
+        return self._get_process_pool()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one concurrency slot, waiting in the bounded queue if needed."""
+        if self.max_queue and self.queued >= self.max_queue:
+            raise EngineBusyError(f"Engine queue is full ({self.queued} waiting).")
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    async def run(self, func, *args):
+        """Run `func(*args)` in the pool once a concurrency slot is free."""
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    async def map(self, func, items: List[Any]) -> List[Any]:
+        """
+        Run `func` over `items` across the process pool, holding one slot for the batch.
+
+        Results come back in input order; a failing item yields its exception
+        in place of a result instead of failing the batch.
+        """
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            pool = self._get_process_pool()
+            futures = [loop.run_in_executor(pool, func, item) for item in items]
+            return await asyncio.gather(*futures, return_exceptions=True)
+
+    async def iterate(self, iterator: Iterator):
+        """
+        Drain a synchronous iterator off the event loop, holding one slot throughout.
+
+        Generators cannot cross process boundaries, so items are always pulled
+        in a thread (the pool itself in thread mode, the loop's default pool
+        otherwise).
+        """
+        executor = self._get_executor() if self.kind == "thread" else None
+        loop = asyncio.get_running_loop()
+        done = object()
+        async with self.slot():
+            while True:
+                item = await loop.run_in_executor(executor, next, iterator, done)
+                if item is done:
+                    return
+                yield item
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executor": self.kind,
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "queued": self.queued,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            for pool in (self._executor, self._process_pool):
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._process_pool = None
+
+
+engine_executor = EngineExecutor(
+    kind=os.environ.get("YMAZE_EXECUTOR", "thread"),
+    max_workers=int(os.environ.get("YMAZE_MAX_WORKERS", "0")) or None,
+    max_concurrency=int(os.environ.get("YMAZE_MAX_CONCURRENCY", "0")) or None,
+    max_queue=int(os.environ.get("YMAZE_MAX_QUEUE", "64")),
+)
+
+
+# ==================== SCHEDULE CACHE ====================
+
+class ScheduleCache:
+    """
+    LRU + TTL cache of computed schedules, keyed by request content.
+
+    Only seeded requests are cached; unseeded ones are meant to differ on
+    every call. Entries are shared by every endpoint that schedules a
+    request, so an export right after a generate reuses the same result.
+    """
+
+    def __init__(self, max_entries: int = 64, ttl_seconds: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(request: ScheduleRequest) -> Optional[str]:
+        """Canonical content hash of a request, or None if it is not cacheable."""
+        if request.seed is None:
+            return None
+        payload = request.dict()
+        if request.use_example or not request.animals:
+            # Example data is read from disk; key on the file version instead
+            try:
+                stat = EXAMPLE_ANIMALS_PATH.stat()
+            except OSError:
+                return None
+            payload["animals"] = None
+            payload["example_version"] = [stat.st_mtime_ns, stat.st_size]
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if key is None or self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Optional[str], value: Dict[str, Any]):
+        if key is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+schedule_cache = ScheduleCache(
+    max_entries=int(os.environ.get("YMAZE_CACHE_SIZE", "64")),
+    ttl_seconds=float(os.environ.get("YMAZE_CACHE_TTL", "600")),
+)
+
+
+# How often a waiting request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.25
+
+
+def _retrieve_exception(task: asyncio.Future):
+    if not task.cancelled():
+        task.exception()
+
+
+async def run_cancellable(aw, cancel: CancellationToken, disconnected=None):
+    """
+    Await `aw`, setting `cancel` once `disconnected()` reports the client has gone.
+
+    The work is still awaited after cancelling so it can release its slot
+    and shared memory; it ends early with ScheduleCancelledError at its next
+    check.
+    """
+    task = asyncio.ensure_future(aw)
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS if disconnected else None)
+            if not task.done() and not cancel.cancelled and await disconnected():
+                cancel.cancel()
+    except asyncio.CancelledError:
+        cancel.cancel()
+        task.add_done_callback(_retrieve_exception)
+        raise
+    return task.result()
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task, cancel: CancellationToken):
+        self.task = task
+        self.cancel = cancel
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical computations.
+
+    The first caller for a key starts the work as a task; callers arriving
+    while it is in flight await the same task instead of starting their own.
+    A None key is never coalesced. Each flight has a CancellationToken that
+    is set only when its last waiter goes away (client disconnect or
+    cancellation); a cancelled flight is never joined by later callers.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self._inflight: Dict[str, _Flight] = {}
+
+    async def do(self, key: Optional[str], func, new_token=CancellationToken, disconnected=None):
+        """
+        Await `func(cancel)` (a coroutine function), sharing one in-flight call per key.
+
+        `disconnected` is an async callable polled while waiting; once it
+        returns True this caller stops waiting with ScheduleCancelledError.
+        """
+        flight = self._inflight.get(key) if key is not None else None
+        if flight is None or flight.cancel.cancelled:
+            cancel = new_token()
+            flight = _Flight(asyncio.ensure_future(func(cancel)), cancel)
+            flight.task.add_done_callback(lambda done, key=key, flight=flight: self._finish(key, flight))
+            if key is not None:
+                self.leaders += 1
+                self._inflight[key] = flight
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await self._wait(flight.task, disconnected)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self.cancelled += 1
+                flight.cancel.cancel()
+
+    @staticmethod
+    async def _wait(task: asyncio.Task, disconnected):
+        # asyncio.wait never cancels `task`, so one caller going away does
+        # not cancel the others' result
+        while True:
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS if disconnected else None)
+            if task.done():
+                return task.result()
+            if await disconnected():
+                raise ScheduleCancelledError("Client disconnected.")
+
+    def _finish(self, key: Optional[str], flight: _Flight):
+        if key is not None and self._inflight.get(key) is flight:
+            del self._inflight[key]
+        # Mark the exception retrieved even if every caller has gone away
+        _retrieve_exception(flight.task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._inflight), "leaders": self.leaders, "coalesced": self.coalesced,
+                "cancelled": self.cancelled}
+
+
+schedule_flights = SingleFlight()
+
+
+async def get_schedule(request: ScheduleRequest, disconnected=None) -> Dict[str, Any]:
+    """
+    Cached `compute_schedule`, run on the engine executor on a miss.
+
+    Concurrent misses for the same seeded request share one computation,
+    which is cancelled once every client waiting on it has disconnected
+    (`disconnected` is polled, e.g. `Request.is_disconnected`).
+    """
+    key = ScheduleCache.key(request)
+    result = schedule_cache.get(key)
+    if result is None:
+        async def compute(cancel: CancellationToken):
+            try:
+                computed = await engine_executor.run_schedule(request, cancel)
+            finally:
+                cancel.close()
+            schedule_cache.put(key, computed)
+            return computed
+
+        result = await schedule_flights.do(key, compute, lambda: engine_executor.cancel_token(request),
+                                           disconnected)
+    return result
+
+
+# ==================== SCHEDULE STORE ====================
+
+class ScheduleStore:
+    """
+    Computed schedules kept server-side under opaque IDs.
+
+    Bounded by entry count (oldest evicted first) and TTL, so downloads of a
+    stored schedule only cost serialization.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, schedule: Dict[str, Any]) -> str:
+        schedule_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries[schedule_id] = (time.monotonic(), schedule)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return schedule_id
+
+    def get(self, schedule_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(schedule_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[schedule_id]
+                return None
+            return entry[1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "ttl_seconds": self.ttl_seconds}
+
+
+schedule_store = ScheduleStore(
+    max_entries=int(os.environ.get("YMAZE_STORE_SIZE", "256")),
+    ttl_seconds=float(os.environ.get("YMAZE_STORE_TTL", "3600")),
+)
+
+
+def stored_schedule(schedule_id: str) -> Dict[str, Any]:
+    """Look up a stored schedule or answer 404."""
+    schedule = schedule_store.get(schedule_id)
+    if schedule is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired schedule id: {schedule_id}")
+    return schedule
+
+
+# ==================== JOB QUEUE ====================
+
+class JobQueue:
+    """
+    In-process background jobs for schedules too large for one HTTP round trip.
+
+    Jobs run on a small thread pool so progress can be reported day by day.
+    At most `max_pending` jobs may be queued or running (EngineBusyError past
+    that), and finished jobs are forgotten `ttl_seconds` after completion.
+    Completed schedules live only in the schedule store, under the job's
+    `schedule_id`, so they share its size and TTL bounds.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 32, ttl_seconds: float = 3600.0):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ymaze-job")
+        return self._executor
+
+    def _purge(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["finished_at"] is not None and now - job["finished_at"] > self.ttl_seconds]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, request: ScheduleRequest) -> Dict[str, Any]:
+        with self._lock:
+            self._purge()
+            pending = sum(1 for job in self._jobs.values() if job["state"] in ("queued", "running"))
+            if pending >= self.max_pending:
+                raise EngineBusyError(f"Job queue is full ({pending} pending).")
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "state": "queued",
+                "days_done": 0,
+                "total_days": max(request.learning_days + request.reversal_days, 0),
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "schedule_id": None,
+                "status": None,
+                "error": None,
+            }
+            self._jobs[job["job_id"]] = job
+            self._get_executor().submit(self._run, job, request)
+            return self.describe(job)
+
+    def _run(self, job: Dict[str, Any], request: ScheduleRequest):
+        job["state"] = "running"
+        job["started_at"] = time.time()
+        try:
+            key = ScheduleCache.key(request)
+            result = schedule_cache.get(key)
+            if result is None:
+                animal_data, exit_arm_map, rng = prepare_schedule(request)
+                day_tables = []
+                for table in iter_request_days(request, animal_data, exit_arm_map, rng):
+                    day_tables.append(table)
+                    job["days_done"] = len(day_tables)
+                result = schedule_result(exit_arm_map, day_tables, rng)
+                schedule_cache.put(key, result)
+            job["days_done"] = job["total_days"]
+            job["schedule_id"] = schedule_store.add(result)
+            job["state"] = "done"
+        except (ScheduleInputError, InfeasibleSequenceError) as e:
+            job.update(state="failed", status=400, error=str(e))
+        except Exception as e:
+            job.update(state="failed", status=500, error=str(e) or type(e).__name__)
+        finally:
+            job["finished_at"] = time.time()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    @staticmethod
+    def describe(job: Dict[str, Any]) -> Dict[str, Any]:
+        """Public status of a job."""
+        info = dict(job)
+        info["progress"] = job["days_done"] / job["total_days"] if job["total_days"] else 1.0
+        return info
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            states = Counter(job["state"] for job in self._jobs.values())
+        return {"max_workers": self.max_workers, "max_pending": self.max_pending,
+                "ttl_seconds": self.ttl_seconds, **{s: states.get(s, 0) for s in ("queued", "running", "done", "failed")}}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+job_queue = JobQueue(
+    max_workers=int(os.environ.get("YMAZE_JOB_WORKERS", "2")),
+    max_pending=int(os.environ.get("YMAZE_JOB_QUEUE", "32")),
+    ttl_seconds=float(os.environ.get("YMAZE_JOB_TTL", "3600")),
+)
+
+
+def known_job(job_id: str) -> Dict[str, Any]:
+    """Look up a job or answer 404."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job id: {job_id}")
+    return job
+
+
+# ==================== API ENDPOINTS ====================
+
+def schedule_payload(result: Dict[str, Any], response_format: str) -> Dict[str, Any]:
+    """
+    Shape a computed schedule as `day_tables` (default) or the columnar view.
+
+    The columnar view walks every row unless the result kept its engine
+    arrays; render with `schedule_response` to keep it off the event loop.
+    """
+    extra = {"seed": result["seed"]} if "seed" in result else {}
+    if response_format == "columnar":
+        columns = (columnar_from_arrays(result["arrays"]) if "arrays" in result
+                   else columnar_from_day_tables(result["day_tables"]))
+        return {"success": True, "format": "columnar", **extra, "exit_arm_map": result["exit_arm_map"], **columns}
+    return {
+        "success": True,
+        **extra,
+        "exit_arm_map": result["exit_arm_map"],
+        "day_tables": result["day_tables"]
+    }
+
+
+async def schedule_response(result: Dict[str, Any], response_format: str, **fields) -> FastJSONResponse:
+    """`fields` plus `schedule_payload`, built and encoded in the threadpool."""
+    return await run_in_threadpool(
+        lambda: FastJSONResponse({**fields, **schedule_payload(result, response_format)}))
+
+
+ResponseFormat = Query("tables", alias="format", pattern="^(tables|columnar)$")
+
+# nginx's non-standard status for a request abandoned by its client
+CLIENT_CLOSED_REQUEST = 499
+
+
+@app.post("/generate-schedule", response_class=FastJSONResponse)
+async def generate_schedule(request: ScheduleRequest, http_request: Request, response_format: str = ResponseFormat):
+    """
+    Generate Y-maze schedule based on input parameters.
+
+    `?format=columnar` returns one animal table plus per-day order/exit/trials
+    arrays instead of repeating animal metadata in every row.
+    """
+    try:
+        result = await get_schedule(request, http_request.is_disconnected)
+        return await schedule_response(result, response_format)
+
+    except (ScheduleInputError, InfeasibleSequenceError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ScheduleCancelledError as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _ndjson_line(obj: Dict[str, Any]) -> bytes:
+    return dumps_json(obj) + b"\n"
+
+
+def iter_schedule_ndjson(request: ScheduleRequest, cancel: Optional[CancellationToken] = None) -> Iterator[bytes]:
+    """
+    NDJSON lines for a request: a header with `exit_arm_map`, then one line per day.
+
+    Days are generated lazily, so only the day being encoded is held in memory;
+    `cancel` stops generation between days.
+    """
+    total_days = request.learning_days + request.reversal_days
+    cached = schedule_cache.get(ScheduleCache.key(request))
+    if cached is not None:
+        header = {k: cached[k] for k in ("exit_arm_map", "seed") if k in cached}
+        days = iter(cached["day_tables"])
+    else:
+        animal_data, exit_arm_map, rng = prepare_schedule(request)
+        header = schedule_result(exit_arm_map, [], rng)
+        del header["day_tables"]
+        days = iter_request_days(request, animal_data, exit_arm_map, rng, cancel=cancel)
+    yield _ndjson_line({**header, "total_days": max(total_days, 0)})
+    for table in days:
+        yield _ndjson_line(table)
+
+
+@app.post("/schedule-cell")
+async def schedule_cell(cell: CellRequest):
+    """
+    Regenerate a single (day, animal) row of a keyed schedule without rebuilding the rest.
+    """
+    try:
+        return await engine_executor.run(regenerate_cell, cell.schedule, cell.day, cell.animal_id)
+    except (ScheduleInputError, InfeasibleSequenceError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/generate-schedules", response_class=FastJSONResponse)
+async def generate_schedules(batch_request: BatchScheduleRequest, http_request: Request,
+                             response_format: str = ResponseFormat):
+    """
+    Schedule several independent cohorts in one request across the process pool.
+
+    Results keep the input order and report each cohort's effective seed; a
+    cohort that is invalid (status 422) or fails gets `success: false` and an
+    error without affecting the others. Cohorts without a seed get one
+    derived from the batch seed, which is drawn at random when omitted and
+    reported, so resending a cohort with its reported seed to
+    /generate-schedule always reproduces it. If the client disconnects,
+    cohorts still running are cancelled and finished ones are kept in the
+    cache.
+    """
+    batch_seed = batch_request.seed
+    if batch_seed is None:
+        batch_seed = random.SystemRandom().getrandbits(63)
+
+    cohorts: List[Optional[ScheduleRequest]] = []
+    results: List[Any] = []
+    for index, body in enumerate(batch_request.cohorts):
+        try:
+            cohort = ScheduleRequest.model_validate(body)
+        except ValidationError as e:
+            cohorts.append(None)
+            results.append(e)
+            continue
+        if cohort.seed is None:
+            cohort = cohort.model_copy(update={"seed": derive_cohort_seed(batch_seed, index)})
+        cohorts.append(cohort)
+        results.append(None)
+
+    keys = [ScheduleCache.key(cohort) if cohort is not None else None for cohort in cohorts]
+    for i, key in enumerate(keys):
+        if key is not None:
+            results[i] = schedule_cache.get(key)
+    pending = [i for i, cohort in enumerate(cohorts) if cohort is not None and results[i] is None]
+    if pending:
+        cancel = CancellationToken(shared=True)
+        try:
+            computed = await run_cancellable(
+                engine_executor.map(partial(compute_schedule_shared, cancel=cancel), [cohorts[i] for i in pending]),
+                cancel, http_request.is_disconnected)
+        except EngineBusyError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        finally:
+            cancel.close()
+
+        def collect():
+            for i, result in zip(pending, computed):
+                if not isinstance(result, BaseException):
+                    # Keep going on failure so every cohort's block is freed
+                    try:
+                        result = schedule_from_shared(result)
+                    except Exception as e:
+                        result = e
+                    else:
+                        schedule_cache.put(keys[i], result)
+                results[i] = result
+
+        # Row rebuilding is CPU-bound; keep it off the event loop
+        await run_in_threadpool(collect)
+        if cancel.cancelled:
+            raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client disconnected.")
+
+    def render():
+        entries = []
+        for index, (cohort, result) in enumerate(zip(cohorts, results)):
+            if isinstance(result, ValidationError):
+                error = "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+                                  for err in result.errors(include_url=False))
+                entries.append({"index": index, "seed": None, "success": False, "status": 422, "error": error})
+            elif isinstance(result, BaseException):
+                status = 400 if isinstance(result, (ScheduleInputError, InfeasibleSequenceError)) else 500
+                entries.append({"index": index, "seed": cohort.seed, "success": False,
+                                "status": status, "error": str(result) or type(result).__name__})
+            else:
+                entries.append({"index": index, "seed": cohort.seed, **schedule_payload(result, response_format)})
+        return FastJSONResponse({"success": all(e["success"] for e in entries), "seed": batch_seed,
+                                 "results": entries})
+
+    # Shaping and encoding up to BATCH_MAX_COHORTS schedules walks every row
+    return await run_in_threadpool(render)
+
+
+@app.post("/generate-schedule-stream")
+async def generate_schedule_stream(request: ScheduleRequest, http_request: Request):
+    """
+    Stream a schedule as NDJSON so clients can render Day 1 before the rest is done.
+
+    Input errors surface as 400 before streaming starts; a failure mid-stream
+    ends the stream with an `{"error": ...}` line. Generation stops at the
+    next day boundary once the client disconnects.
+    """
+    cancel = engine_executor.cancel_token(request)
+    lines = iter_schedule_ndjson(request, cancel)
+    stream = engine_executor.iterate(lines)
+    try:
+        first = await run_cancellable(stream.__anext__(), cancel, http_request.is_disconnected)
+    except (ScheduleInputError, InfeasibleSequenceError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ScheduleCancelledError as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def body():
+        yield first
+        try:
+            async for line in stream:
+                yield line
+        except Exception as e:
+            yield _ndjson_line({"error": str(e)})
+        finally:
+            # Also reached when Starlette cancels the body on disconnect
+            cancel.cancel()
+            await stream.aclose()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@app.post("/schedule-from-file", response_class=FastJSONResponse)
+async def schedule_from_file(
+    http_request: Request,
+    file: UploadFile = File(...),
+    learning_days: int = Form(...),
+    reversal_days: int = Form(...),
+    trials_per_day: int = Form(...),
+    seed: Optional[int] = Form(None),
+    batch: bool = Form(False),
+    exact_cage_order: bool = Form(False),
+    response_format: str = ResponseFormat,
+):
+    """
+    Generate a schedule from an uploaded CSV/TSV/XLSX animal list.
+
+    The file is parsed in chunks straight into column arrays; the response
+    matches /generate-schedule.
+    """
+    try:
+        animals = await run_in_threadpool(parse_animal_file, file.file, file.filename)
+        if not len(animals):
+            raise ScheduleInputError("No animals found in the uploaded file.")
+        request = ScheduleRequest(
+            animals=animals,
+            learning_days=learning_days,
+            reversal_days=reversal_days,
+            trials_per_day=trials_per_day,
+            seed=seed,
+            batch=batch,
+            exact_cage_order=exact_cage_order,
         )
+        result = await get_schedule(request, http_request.is_disconnected)
+        return await schedule_response(result, response_format)
+
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    except (ScheduleInputError, InfeasibleSequenceError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ScheduleCancelledError as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Create Excel file in memory
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            for table in day_tables:
-                df = pd.DataFrame(table['rows'], columns=table['header'])
-                sheet_name = f"Day{table['day']}_{table['type']}"
-                df.to_excel(writer, sheet_name=sheet_name, index=False)
 
-        output.seek(0)
-        
+@app.post("/export-excel")
+async def export_excel(request: ScheduleRequest, http_request: Request):
+    """
+    Export schedule to Excel file with separate sheets for each day, streamed as it is written.
+    """
+    try:
+        result = await get_schedule(request, http_request.is_disconnected)
         return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            iter_excel_workbook(result["day_tables"]),
+            media_type=XLSX_MEDIA_TYPE,
             headers={"Content-Disposition": "attachment; filename=ymaze_schedule.xlsx"}
         )
 
-    except HTTPException:
-        raise
+    except (ScheduleInputError, InfeasibleSequenceError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ScheduleCancelledError as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/export-csv")
+async def export_csv(request: ScheduleRequest, http_request: Request):
+    """
+    Export schedule as one combined CSV with Day and Type columns, streamed in chunks.
+    """
+    try:
+        result = await get_schedule(request, http_request.is_disconnected)
+        return StreamingResponse(
+            iter_csv(result["day_tables"]),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=ymaze_all_days.csv"}
+        )
+
+    except (ScheduleInputError, InfeasibleSequenceError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ScheduleCancelledError as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/export-csv-zip")
+async def export_csv_zip(request: ScheduleRequest, http_request: Request):
+    """
+    Export schedule as a ZIP with one CSV per day, streamed in chunks.
+    """
+    try:
+        result = await get_schedule(request, http_request.is_disconnected)
+        return StreamingResponse(
+            iter_csv_zip(result["day_tables"]),
+            media_type="application/zip",
+            headers={"Content-Disposition": "attachment; filename=ymaze_day_csvs.zip"}
+        )
+
+    except (ScheduleInputError, InfeasibleSequenceError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ScheduleCancelledError as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/schedules")
+async def create_schedule(request: ScheduleRequest, http_request: Request):
+    """
+    Generate a schedule once and store it; returns an ID for later downloads.
+    """
+    try:
+        result = await get_schedule(request, http_request.is_disconnected)
+    except (ScheduleInputError, InfeasibleSequenceError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ScheduleCancelledError as e:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail=str(e))
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    schedule_id = schedule_store.add(result)
+    return {
+        "success": True,
+        "schedule_id": schedule_id,
+        "days": len(result["day_tables"]),
+        "animals": len(result["exit_arm_map"]),
+    }
+
+
+@app.get("/schedules/{schedule_id}", response_class=FastJSONResponse)
+async def get_stored_schedule(schedule_id: str, response_format: str = ResponseFormat):
+    """Return a stored schedule in the same shape as /generate-schedule."""
+    result = stored_schedule(schedule_id)
+    return await schedule_response(result, response_format, schedule_id=schedule_id)
+
+
+@app.get("/schedules/{schedule_id}/xlsx")
+async def export_stored_schedule_xlsx(schedule_id: str):
+    """Download a stored schedule as an Excel workbook."""
+    result = stored_schedule(schedule_id)
+    return StreamingResponse(
+        iter_excel_workbook(result["day_tables"]),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f"attachment; filename=ymaze_schedule_{schedule_id}.xlsx"}
+    )
+
+
+@app.get("/schedules/{schedule_id}/csv")
+async def export_stored_schedule_csv(schedule_id: str):
+    """Download a stored schedule as a single CSV with Day and Type columns."""
+    result = stored_schedule(schedule_id)
+    return StreamingResponse(
+        iter_csv(result["day_tables"]),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=ymaze_schedule_{schedule_id}.csv"}
+    )
+
+
+@app.get("/schedules/{schedule_id}/csv-zip")
+async def export_stored_schedule_csv_zip(schedule_id: str):
+    """Download a stored schedule as a ZIP of per-day CSVs."""
+    result = stored_schedule(schedule_id)
+    return StreamingResponse(
+        iter_csv_zip(result["day_tables"]),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=ymaze_schedule_{schedule_id}.zip"}
+    )
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: ScheduleRequest):
+    """
+    Queue a schedule for background generation; poll GET /jobs/{id} for progress.
+    """
+    try:
+        return job_queue.submit(request)
+    except EngineBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job state (queued/running/done/failed), days completed and, once done, its schedule_id."""
+    return JobQueue.describe(known_job(job_id))
+
+
+@app.get("/jobs/{job_id}/result", response_class=FastJSONResponse)
+async def get_job_result(job_id: str, response_format: str = ResponseFormat):
+    """Result of a finished job, in the same shape as /generate-schedule."""
+    job = known_job(job_id)
+    if job["state"] == "failed":
+        raise HTTPException(status_code=job["status"], detail=job["error"])
+    if job["state"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is still {job['state']}.")
+    result = schedule_store.get(job["schedule_id"])
+    if result is None:
+        raise HTTPException(status_code=410, detail=f"Result of job {job_id} has expired from the schedule store.")
+    return await schedule_response(result, response_format, job_id=job_id, schedule_id=job["schedule_id"])
+
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy"}
+    """Health check endpoint; also reports engine load, cache and coalescing counters."""
+    return {"status": "healthy", "engine": engine_executor.stats(), "cache": schedule_cache.stats(),
+            "store": schedule_store.stats(), "jobs": job_queue.stats(),
+            "coalescing": schedule_flights.stats()}
 
 
 if __name__ == "__main__":
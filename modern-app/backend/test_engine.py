@@ -0,0 +1,159 @@
+"""
+Checks for the scheduling kernels that are easy to get subtly wrong.
+
+    cd modern-app/backend && python -m pytest -q
+"""
+
+import io
+import random
+from itertools import permutations, product
+
+import numpy as np
+import openpyxl
+import pytest
+
+import main
+
+
+def random_cohort(rng: random.Random, n_cages: int, max_cage_size: int):
+    """Animals grouped by cage plus a random learning exit per animal."""
+    animals = [{"AnimalID": f"C{c}A{i}", "Tag": "", "Sex": "M", "Genotype": "WT", "Cage": f"C{c}"}
+               for c in range(n_cages) for i in range(rng.randint(1, max_cage_size))]
+    exits = {a["AnimalID"]: rng.randint(1, 3) for a in animals}
+    return main.group_animals_by_cage_in_order(animals), exits
+
+
+def walk_order(start_arm, sequence, plans):
+    """(switches, plan used per cage) for a cyclic day visiting `sequence` from `start_arm`."""
+    prev, total, used = start_arm, 0, {}
+    for c in sequence:
+        used[c] = plans[c][prev]
+        total += used[c]["cost"]
+        prev = used[c]["end"]
+    return total + (0 if prev == start_arm else 1), used
+
+
+@pytest.mark.parametrize("case", range(400))
+def test_exact_cage_order_matches_brute_force(case):
+    rng = random.Random(case)
+    cages, exits = random_cohort(rng, n_cages=rng.randint(1, 5), max_cage_size=4)
+    names = list(cages)
+    plans = main.plan_all_cages(cages, exits)
+
+    start_arm, sequence, chosen, total = main.solve_cage_order_exact(names, plans)
+
+    assert sorted(sequence) == sorted(names)
+    assert walk_order(start_arm, sequence, plans) == (total, chosen)
+    assert total == min(walk_order(s, p, plans)[0] for s in (1, 2, 3) for p in permutations(names))
+
+
+@pytest.mark.parametrize("case", range(300))
+def test_batched_cage_dp_matches_plan_cage_dp(case):
+    rng = random.Random(10_000 + case)
+    cages, exits = random_cohort(rng, n_cages=rng.randint(1, 12), max_cage_size=8)
+
+    plans = main.plan_all_cages(cages, exits)
+
+    for cage, animals in cages.items():
+        for arm in (1, 2, 3):
+            assert plans[cage][arm] == main.plan_cage_dp(animals, arm, exits)
+
+
+class BranchRng:
+    """Replays `choices`, then takes the first option; each call offers its extreme outcomes as options."""
+
+    def __init__(self, choices):
+        self.choices, self.options = choices, []
+
+    def _pick(self, options):
+        i = len(self.options)
+        self.options.append(options)
+        return options[self.choices[i] if i < len(self.choices) else 0]
+
+    def randrange(self, n):
+        return self._pick(sorted({0, n - 1}))
+
+    def random(self):
+        return self._pick([0.0, 0.75])
+
+
+def reachable_templates(draw):
+    """Every template `draw(rng)` can return, found by walking each branch its rng calls can take."""
+    found, stack = set(), [[]]
+    while stack:
+        choices = stack.pop()
+        rng = BranchRng(choices)
+        found.add(tuple(draw(rng)))
+        for i in range(len(choices), len(rng.options)):
+            stack.extend(choices + [0] * (i - len(choices)) + [k] for k in range(1, len(rng.options[i])))
+    return found
+
+
+def valid_templates(n, balanced, forbid_first):
+    """Brute force: 0/1 sequences of length n with no triple repeat that pass `balanced`."""
+    return {seq for seq in product((0, 1), repeat=n)
+            if balanced(seq.count(0), seq.count(1))
+            and not any(seq[i] == seq[i + 1] == seq[i + 2] for i in range(n - 2))
+            and (n == 0 or seq[0] != forbid_first)}
+
+
+@pytest.mark.parametrize("count_a,count_b", [(a, b) for a in range(6) for b in range(6)])
+@pytest.mark.parametrize("forbid_first", [None, 0, 1])
+def test_sample_sequence_template_reaches_every_valid_template(count_a, count_b, forbid_first):
+    counts = main.count_valid_sequences(5, 5)
+    expected = valid_templates(count_a + count_b, lambda a, b: (a, b) == (count_a, count_b), forbid_first)
+
+    def draw(rng):
+        return main.sample_sequence_template(counts, count_a, count_b, forbid_first, rng=rng)
+
+    if not expected:
+        with pytest.raises(main.InfeasibleSequenceError):
+            draw(random.Random(0))
+    else:
+        assert reachable_templates(draw) == expected
+
+
+@pytest.mark.parametrize("n_trials", range(1, 11))
+@pytest.mark.parametrize("forbid_first", [None, 0, 1])
+def test_sequence_template_sampler_reaches_every_valid_template(n_trials, forbid_first):
+    sampler = main.SequenceTemplateSampler(n_trials)
+    expected = valid_templates(n_trials, lambda a, b: abs(a - b) <= 1, forbid_first)
+
+    assert reachable_templates(lambda rng: sampler.sample(forbid_first, rng)) == expected
+
+
+# Random123 known-answer vectors for philox4x32-10: (counter, key, output)
+PHILOX_KAT = [
+    ((0x00000000, 0x00000000, 0x00000000, 0x00000000), (0x00000000, 0x00000000),
+     (0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8)),
+    ((0xffffffff, 0xffffffff, 0xffffffff, 0xffffffff), (0xffffffff, 0xffffffff),
+     (0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd)),
+    ((0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344), (0xa4093822, 0x299f31d0),
+     (0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1)),
+]
+
+
+def test_philox_known_answers():
+    counters = np.array([c for c, _, _ in PHILOX_KAT], dtype=np.uint64)
+    keys = np.array([k for _, k, _ in PHILOX_KAT], dtype=np.uint64)
+
+    out = main.philox4x32(counters, keys)
+
+    assert out.tolist() == [list(expected) for _, _, expected in PHILOX_KAT]
+
+
+def test_streamed_workbook_round_trips_through_openpyxl():
+    request = main.ScheduleRequest(animals=[], use_example=True, learning_days=1, reversal_days=1,
+                                   trials_per_day=4, seed=7)
+    day_tables = main.compute_schedule(request)["day_tables"]
+    day_tables[0]["type"] = "A&<b>\x01:*"
+    day_tables[0]["rows"][0][1] = "x & <y> \x07z\x1f"
+    day_tables[1]["rows"][0][1] = float("nan")
+
+    workbook = openpyxl.load_workbook(io.BytesIO(b"".join(main.iter_excel_workbook(day_tables))))
+
+    assert workbook.sheetnames == ["Day1_A&<b>", f"Day2_{day_tables[1]['type']}"]
+    day_tables[0]["rows"][0][1] = "x & <y> z"
+    day_tables[1]["rows"][0][1] = None
+    for sheet, table in zip(workbook.worksheets, day_tables):
+        assert [list(row) for row in sheet.iter_rows(values_only=True)] == [table["header"]] + table["rows"]